@@ -16,7 +16,7 @@ sys.path.insert(0, parent_dir)
 from core.config import TICKET_PRICE_AED, get_ziina_config
 from services.payments_ziina import has_ziina_configured, create_payment_intent
 from utils.logic import get_next_booking_id, create_booking_and_get_amount
-from utils.io import load_bookings, save_bookings
+from utils.io import load_bookings, update_booking
 
 # Page config
 st.set_page_config(
@@ -44,22 +44,8 @@ if "booking_id" not in st.session_state:
 if "show_booking_form" not in st.session_state:
     st.session_state.show_booking_form = False
 
-# Load the original HTML file from Fhdd folder
-html_file_path = Path(__file__).parent / "1.html"
-
-if st.session_state.page == "landing" and not st.session_state.show_booking_form:
-    # Display original HTML
-    if html_file_path.exists():
-        html_content = html_file_path.read_text(encoding="utf-8")
-        
-        # Inject booking form handler
-        html_content = html_content.replace(
-            'onsubmit="return false;"',
-            'onsubmit="return handleBooking(event);"'
-        )
-        
-        # Add JavaScript to communicate with Streamlit
-        booking_js = """
+# Booking form handler injected into the original HTML
+BOOKING_JS = """
         <script>
         function handleBooking(event) {
             event.preventDefault();
@@ -89,7 +75,29 @@ if st.session_state.page == "landing" and not st.session_state.show_booking_form
         });
         </script>
         """
-        html_content = html_content.replace('</body>', booking_js + '</body>')
+
+# Landing page shipped with this app
+LANDING_HTML = Path(__file__).parent / "1.html"
+
+
+@st.cache_data(show_spinner=False)
+def landing_html(mtime_ns: int) -> str:
+    """Original HTML with the booking handler, rebuilt only when the file changes."""
+    html_content = LANDING_HTML.read_text(encoding="utf-8")
+    html_content = html_content.replace(
+        'onsubmit="return false;"',
+        'onsubmit="return handleBooking(event);"'
+    )
+    return html_content.replace('</body>', BOOKING_JS + '</body>')
+
+
+# Load the original HTML file from Fhdd folder
+html_file_path = LANDING_HTML
+
+if st.session_state.page == "landing" and not st.session_state.show_booking_form:
+    # Display original HTML
+    if html_file_path.exists():
+        html_content = landing_html(html_file_path.stat().st_mtime_ns)
         
         # Display the HTML
         components.html(html_content, height=2800, scrolling=True)
@@ -228,13 +236,11 @@ elif st.session_state.show_booking_form or st.session_state.page == "booking":
                             )
                             
                             # Update booking with payment intent
-                            df = load_bookings()
-                            mask = df["booking_id"] == booking_id
-                            if mask.any():
-                                payment_intent_id = str(pi.get("id", ""))
-                                df.loc[mask, "payment_intent_id"] = payment_intent_id
-                                df.loc[mask, "payment_status"] = pi.get("status", "pending")
-                                save_bookings(df)
+                            update_booking(
+                                booking_id,
+                                payment_intent_id=str(pi.get("id", "")),
+                                payment_status=pi.get("status", "pending"),
+                            )
                             
                             if redirect_url:
                                 st.success(f"✅ تم إنشاء الحجز رقم: {booking_id}")
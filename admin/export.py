@@ -0,0 +1,164 @@
+"""Admin export routes: streamed CSV / NDJSON and background-built XLSX.
+
+XLSX files are named after the filter set and the store generation they
+were built at. While a newer one is being built, the newest finished file
+for the same filters is served, with its generation in
+``X-Export-Generation``, so bookings changing between polls never leave
+an export unreachable.
+"""
+from __future__ import annotations
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+from datetime import date
+from pathlib import Path
+from typing import Iterator, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.security import HTTPBasicCredentials
+from admin.routes import verify_pin
+from core.config import EXPORTS_DIR
+from core.runtime import run_blocking
+from utils.io import COLUMNS, iter_bookings, store_generation, write_bookings_xlsx
+from utils.locks import LockUnavailable, file_lock
+
+router = APIRouter(prefix="/admin")
+
+# XLSX builds running in this worker, keyed by export file name
+_xlsx_jobs: dict[str, asyncio.Future] = {}
+
+FORMATS = ("csv", "ndjson", "xlsx")
+_CHUNK_ROWS = 500
+
+
+def _check_date(value: Optional[str], name: str) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be YYYY-MM-DD")
+
+
+def _csv_chunks(rows: Iterator[dict]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % _CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def _ndjson_chunks(rows: Iterator[dict]) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, default=str))
+        if len(lines) == _CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _xlsx_prefix(date_from, date_to, status) -> str:
+    key = json.dumps([date_from, date_to, status])
+    return f"bookings-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _latest_xlsx(prefix: str) -> Optional[tuple[Path, int]]:
+    """Newest finished export for a filter set and its generation."""
+    found = []
+    for path in EXPORTS_DIR.glob(f"{prefix}-g*.xlsx"):
+        try:
+            found.append((int(path.stem.rsplit("-g", 1)[1]), path))
+        except ValueError:
+            continue
+    if not found:
+        return None
+    generation, path = max(found)
+    return path, generation
+
+
+def _xlsx_response(path: Path, generation: int) -> FileResponse:
+    return FileResponse(
+        path, filename="bookings.xlsx",
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"X-Export-Generation": str(generation)},
+    )
+
+
+def _build_xlsx(name: str, date_from, date_to, status) -> None:
+    """Write the export with openpyxl's write-only mode, one row at a time."""
+    EXPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    target = EXPORTS_DIR / name
+    digest_prefix = name.rsplit("-g", 1)[0]
+    try:
+        with file_lock(EXPORTS_DIR / f".{digest_prefix}.lock", blocking=False):
+            if target.exists():
+                return
+            tmp = EXPORTS_DIR / f".{name}.{os.getpid()}.tmp"
+            try:
+                write_bookings_xlsx(tmp, iter_bookings(date_from, date_to, status))
+                os.replace(tmp, target)
+            finally:
+                tmp.unlink(missing_ok=True)
+            # Only the newest export per filter set is kept
+            for old in EXPORTS_DIR.glob(f"{digest_prefix}-g*.xlsx"):
+                if old.name != name:
+                    old.unlink(missing_ok=True)
+    except LockUnavailable:
+        return  # another worker is building it
+
+
+@router.get("/export")
+async def export_bookings(
+    format: str = "csv",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    status: Optional[str] = None,
+    credentials: HTTPBasicCredentials = Depends(verify_pin),
+):
+    """Export bookings. CSV/NDJSON stream directly; XLSX is built in the
+    background and served from cache once ready (poll until 200). While a
+    newer XLSX is being built the previous one is served."""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    date_from = _check_date(date_from, "date_from")
+    date_to = _check_date(date_to, "date_to")
+    status = status or None
+
+    if format == "csv":
+        rows = iter_bookings(date_from, date_to, status)
+        return StreamingResponse(
+            _csv_chunks(rows), media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="bookings.csv"'},
+        )
+    if format == "ndjson":
+        rows = iter_bookings(date_from, date_to, status)
+        return StreamingResponse(_ndjson_chunks(rows), media_type="application/x-ndjson")
+
+    prefix = _xlsx_prefix(date_from, date_to, status)
+    generation = await run_blocking(store_generation)
+    name = f"{prefix}-g{generation}.xlsx"
+    target = EXPORTS_DIR / name
+    if target.exists():
+        return _xlsx_response(target, generation)
+    for key, job in list(_xlsx_jobs.items()):
+        if job.done():
+            del _xlsx_jobs[key]
+            if job.exception() is not None:
+                logging.error(f"XLSX export {key} failed: {job.exception()}")
+    if name not in _xlsx_jobs:
+        _xlsx_jobs[name] = asyncio.ensure_future(run_blocking(_build_xlsx, name, date_from, date_to, status))
+    latest = await run_blocking(_latest_xlsx, prefix)
+    if latest is not None:
+        return _xlsx_response(*latest)
+    return JSONResponse({"status": "building", "retry_after": 2}, status_code=202, headers={"Retry-After": "2"})
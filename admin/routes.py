@@ -5,13 +5,24 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.templating import Jinja2Templates
 from core.config import ADMIN_PIN, PAGES_DIR
-from services.payments_ziina import sync_all_bookings
-from utils.io import load_bookings, save_bookings
+from core.runtime import run_blocking, loop_lag
+from services.intent_cache import intent_cache
+from services.payments_ziina import async_sync_pending_bookings
+from services.reconciler import reconciler
+from services.ticket_render import ticket_renderer
+from services.ziina_client import get_client
+from utils.assets import asset_url
+from utils.io import booking_history, cache_stats, checkin_totals, index_stats, booking_summary, recent_bookings
+from utils.ticket_generator import ticket_cache_stats
+from utils.ticket_qr import pregenerate_day, stats as qr_stats
 from utils.settings_utils import load_settings, save_settings
 import secrets
+from datetime import date
+import urllib.parse
 
 router = APIRouter(prefix="/admin")
 templates = Jinja2Templates(directory=str(PAGES_DIR))
+templates.env.globals["asset_url"] = asset_url
 security = HTTPBasic()
 
 
@@ -30,25 +41,14 @@ def verify_pin(credentials: HTTPBasicCredentials = Depends(security)):
 @router.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request, credentials: HTTPBasicCredentials = Depends(verify_pin)):
     """Admin dashboard: show bookings and KPIs."""
-    df = load_bookings()
-    
-    total_bookings = len(df)
-    total_tickets = int(df["tickets"].sum()) if not df.empty else 0
-    total_amount = float(df["total_amount"].sum()) if not df.empty else 0.0
-    total_paid = float(df[df["status"] == "paid"]["total_amount"].sum()) if not df.empty else 0.0
-    total_pending = float(df[df["status"] == "pending"]["total_amount"].sum()) if not df.empty else 0.0
-    
-    bookings = df.sort_values("created_at", ascending=False).head(25).to_dict("records") if not df.empty else []
+    summary = await run_blocking(booking_summary)
+    bookings = await run_blocking(recent_bookings, 25)
     
     return templates.TemplateResponse(
         "admin_dashboard.html",
         {
             "request": request,
-            "total_bookings": total_bookings,
-            "total_tickets": total_tickets,
-            "total_amount": total_amount,
-            "total_paid": total_paid,
-            "total_pending": total_pending,
+            **summary,
             "bookings": bookings,
         },
     )
@@ -57,15 +57,49 @@ async def dashboard(request: Request, credentials: HTTPBasicCredentials = Depend
 @router.post("/sync")
 async def sync_payments(credentials: HTTPBasicCredentials = Depends(verify_pin)):
     """Sync payment status with Ziina."""
-    df = load_bookings()
-    df = sync_all_bookings(df)
-    return RedirectResponse(url="/admin/dashboard", status_code=303)
+    summary = await async_sync_pending_bookings()
+    query = urllib.parse.urlencode({f"sync_{k}": v for k, v in summary.items()})
+    return RedirectResponse(url=f"/admin/dashboard?{query}", status_code=303)
+
+
+@router.get("/bookings/{booking_id}/history")
+async def booking_history_route(booking_id: str, credentials: HTTPBasicCredentials = Depends(verify_pin)):
+    """State-transition history of one booking."""
+    return {"booking_id": booking_id, "events": await run_blocking(booking_history, booking_id)}
+
+
+@router.post("/tickets/pregenerate")
+async def pregenerate_ticket_qr(day: str = "", credentials: HTTPBasicCredentials = Depends(verify_pin)):
+    """Encode the QR codes of a day's paid bookings ahead of gate opening."""
+    day = day or date.today().isoformat()
+    try:
+        date.fromisoformat(day)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="day must be YYYY-MM-DD")
+    return await run_blocking(pregenerate_day, day)
+
+
+@router.get("/metrics")
+async def metrics(credentials: HTTPBasicCredentials = Depends(verify_pin)):
+    """Runtime counters for the booking store and payment lookups."""
+    return {
+        "bookings_cache": cache_stats(),
+        "bookings_index": index_stats(),
+        "intent_cache": intent_cache.stats(),
+        "ziina_breaker": get_client().breaker.stats(),
+        "reconciler": reconciler.stats(),
+        "tickets": ticket_cache_stats(),
+        "ticket_render": ticket_renderer.stats(),
+        "ticket_qr": qr_stats(),
+        "checkins_today": await run_blocking(checkin_totals, date.today().isoformat()),
+        "event_loop_lag": loop_lag.stats(),
+    }
 
 
 @router.get("/settings", response_class=HTMLResponse)
 async def settings_page(request: Request, credentials: HTTPBasicCredentials = Depends(verify_pin)):
     """Admin settings page."""
-    settings = load_settings()
+    settings = await run_blocking(load_settings)
     return templates.TemplateResponse("admin_settings.html", {"request": request, "settings": settings})
 
 
@@ -76,11 +110,11 @@ async def save_settings_route(
 ):
     """Save admin settings."""
     form_data = await request.form()
-    settings = load_settings()
+    settings = await run_blocking(load_settings)
     
     # Update settings from form
     for key in form_data:
         settings[key] = form_data[key]
     
-    save_settings(settings)
+    await run_blocking(save_settings, settings)
     return RedirectResponse(url="/admin/settings?saved=true", status_code=303)
@@ -0,0 +1,31 @@
+"""Static assets: fingerprinted URLs with immutable caching and precompressed bodies."""
+from __future__ import annotations
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from utils.assets import lookup
+from utils.http_cache import choose_encoding, etag_matches
+
+router = APIRouter()
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Unhashed URLs (old links, external references) may change under the same name
+REVALIDATE = "public, max-age=300, must-revalidate"
+
+
+@router.get("/assets/{path:path}", name="assets")
+async def serve_asset(path: str, request: Request):
+    asset, hashed = lookup(path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    variants = {"gzip": asset.gzip, "br": asset.br}
+    coding = choose_encoding(request.headers.get("accept-encoding", ""), [c for c, p in variants.items() if p])
+    headers = {
+        "Cache-Control": IMMUTABLE if hashed else REVALIDATE,
+        "ETag": f'"{asset.digest[:32]}"' if coding is None else f'"{asset.digest[:32]}-{coding}"',
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), f'"{asset.digest[:32]}"'):
+        return Response(status_code=304, headers=headers)
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    return FileResponse(variants[coding] if coding else asset.path, media_type=asset.media_type, headers=headers)
@@ -0,0 +1,59 @@
+"""Gate check-in: scanners post the ticket QR token, guests are admitted once.
+
+The token carries booking id, ticket count and validity under an HMAC
+(``utils.ticket_tokens``), so a scan costs one constant-time signature
+check and one small transaction on the ``checkins`` table; the bookings
+table is not read. A multi-ticket booking may enter in several groups
+until all its places are used; after that the token is rejected.
+"""
+from __future__ import annotations
+import logging
+import secrets
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from core.config import CHECKIN_PIN
+from core.runtime import run_blocking
+from utils.io import admit_guests
+from utils.ticket_tokens import verify_ticket
+
+router = APIRouter()
+security = HTTPBasic()
+
+
+def verify_staff(credentials: HTTPBasicCredentials = Depends(security)):
+    """Gate scanners authenticate with HTTP Basic Auth (username=gate, password=CHECKIN_PIN)."""
+    if not secrets.compare_digest(credentials.password.encode("utf-8"), CHECKIN_PIN.encode("utf-8")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect PIN",
+            headers={"WWW-Authenticate": "Basic"},
+        )
+    return credentials
+
+
+@router.post("/checkin")
+async def checkin(request: Request, credentials: HTTPBasicCredentials = Depends(verify_staff)):
+    """Admit ``count`` guests (default: all remaining) for a scanned ``token``."""
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON.")
+    if not isinstance(payload, dict) or not isinstance(payload.get("token"), str):
+        raise HTTPException(status_code=400, detail="Body must be {\"token\": ..., \"count\": optional int}.")
+    count = payload.get("count")
+    if count is not None and (not isinstance(count, int) or isinstance(count, bool) or count <= 0):
+        raise HTTPException(status_code=400, detail="count must be a positive integer.")
+
+    claims = verify_ticket(payload["token"])
+    if claims is None:
+        return JSONResponse({"status": "invalid"}, status_code=403)
+
+    result = await run_blocking(admit_guests, claims.booking_id, claims.tickets, count)
+    body = {"booking_id": claims.booking_id, **result}
+    if result["admitted_now"]:
+        return {"status": "admitted", **body}
+    # Nothing admitted: either every place is used, or the group is larger than what is left
+    outcome = "already_used" if result["remaining"] == 0 else "exceeds_remaining"
+    logging.warning(f"Check-in rejected for {claims.booking_id}: {outcome}")
+    return JSONResponse({"status": outcome, **body}, status_code=409)
@@ -1,61 +1,87 @@
 """Public-facing routes: landing, booking, payment result."""
 from __future__ import annotations
+import asyncio
+import hashlib
+import json
 import logging
+import time
 import urllib.parse
-from pathlib import Path
 from fastapi import APIRouter, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
-from core.config import TICKET_PRICE_AED, PAGES_DIR
-from services.payments_ziina import has_ziina_configured, create_payment_intent, get_payment_intent
-from utils.logic import create_booking_and_get_amount
-from utils.io import load_bookings, save_bookings
+from core.config import (
+    BOOK_CLAIM_LEASE, BOOK_DEDUP_WINDOW, BOOK_IDEMPOTENCY_TTL, LANDING_HTML, TICKET_PRICE_AED, PAGES_DIR,
+    ZIINA_REQUEST_BUDGET,
+)
+from core.runtime import run_blocking
+from services.intent_cache import TERMINAL_STATUSES
+from services.payments_ziina import has_ziina_configured, acreate_payment_intent, aget_payment_intent
+from services.ticket_render import RenderQueueFull, ticket_renderer
+from utils.logic import apply_payment_status, new_booking
+from utils.assets import asset_url, rewrite_asset_urls
+from utils.io import (
+    get_booking, find_booking_by_intent, insert_booking, update_booking,
+    claim_idempotency_key, idempotent_response, release_idempotency_key,
+)
+from utils.http_cache import PrecomputedPage, cached_response, etag_matches
+from utils.models import Booking, BookingStatus
+from utils.ticket_generator import render_ticket
+from utils.ticket_image import FORMATS as TICKET_FORMATS
 
 router = APIRouter()
 templates = Jinja2Templates(directory=str(PAGES_DIR))
+templates.env.globals["asset_url"] = asset_url
 
 logging.basicConfig(level=logging.INFO)
 
+# Hidden field filled in the browser, so every page load submits its own
+# key while the landing HTML itself stays identical for every visitor
+_IDEMPOTENCY_FIELD = (
+    '<input type="hidden" name="idempotency_key" />'
+    "<script>document.currentScript.previousElementSibling.value = "
+    "(crypto.randomUUID ? crypto.randomUUID() : Date.now() + '-' + Math.random());</script>"
+)
+
+def _rewrite_landing(content: str) -> str:
+    # Replace booking form action to point to /book
+    content = content.replace('action="#"', 'action="/book"')
+    content = content.replace('onsubmit="return false;"', '')
+    content = content.replace('</form>', _IDEMPOTENCY_FIELD + '</form>', 1)
+    return rewrite_asset_urls(content)
+
+
+# Rewritten once and served from memory; rebuilt when 1.html changes
+landing = PrecomputedPage(LANDING_HTML, _rewrite_landing)
+
+
 @router.get("/", response_class=HTMLResponse)
 async def landing_page(request: Request):
     """Serve the landing page (1.html)."""
-    landing_html = Path(__file__).resolve().parent.parent.parent / "FHD" / "1.html"
-    if landing_html.exists():
-        content = landing_html.read_text(encoding="utf-8")
-        # Replace booking form action to point to /book
-        content = content.replace('action="#"', 'action="/book"')
-        content = content.replace('onsubmit="return false;"', '')
-        return HTMLResponse(content=content)
+    page = await landing.get()
+    if page is not None:
+        return cached_response(request, page)
     else:
         return templates.TemplateResponse("landing.html", {"request": request, "ticket_price": TICKET_PRICE_AED})
 
 
-@router.post("/book")
-async def book_ticket(
-    name: str = Form(...),
-    phone: str = Form(...),
-    tickets: int = Form(...),
-    notes: str = Form(""),
-):
-    """Create booking and redirect to Ziina payment."""
-    if not name.strip() or not phone.strip():
-        raise HTTPException(status_code=400, detail="Name and phone required.")
-    
-    form_data = {"name": name, "phone": phone, "tickets": int(tickets), "notes": notes}
-    booking_id, total_amount = create_booking_and_get_amount(form_data)
-    
-    if not has_ziina_configured():
-        logging.warning("Ziina not configured; booking saved as pending.")
-        return HTMLResponse(
-            f"<h1>Booking Created</h1><p>Booking ID: {booking_id}</p>"
-            f"<p>Total: {total_amount:.2f} AED</p>"
-            "<p>Ziina payment not configured. Contact admin to complete payment.</p>"
-        )
-    
-    pi = create_payment_intent(total_amount, booking_id, name)
-    if not pi:
-        raise HTTPException(status_code=500, detail="Failed to create payment intent.")
-    
+def _find_first_url(obj):
+    if isinstance(obj, str) and (obj.startswith("http://") or obj.startswith("https://")):
+        return obj
+    if isinstance(obj, dict):
+        for v in obj.values():
+            found = _find_first_url(v)
+            if found:
+                return found
+    if isinstance(obj, list):
+        for item in obj:
+            found = _find_first_url(item)
+            if found:
+                return found
+    return None
+
+
+def _intent_fields(pi: dict) -> dict:
+    """Booking fields recording a newly created payment intent."""
     payment_intent_id = str(
         pi.get("id")
         or pi.get("payment_intent_id")
@@ -67,40 +93,184 @@ async def book_ticket(
         or pi.get("hosted_page_url")
         or (pi.get("next_action") or {}).get("redirect_url")
     )
-    
-    def _find_first_url(obj):
-        if isinstance(obj, str) and (obj.startswith("http://") or obj.startswith("https://")):
-            return obj
-        if isinstance(obj, dict):
-            for v in obj.values():
-                found = _find_first_url(v)
-                if found:
-                    return found
-        if isinstance(obj, list):
-            for item in obj:
-                found = _find_first_url(item)
-                if found:
-                    return found
-        return None
-    
     if not redirect_url:
         redirect_url = _find_first_url(pi)
+
+    fields = {"payment_intent_id": payment_intent_id or "", "redirect_url": redirect_url}
+    if pi.get("status"):
+        fields["payment_status"] = pi.get("status")
+    if pi.get("status") == "completed":
+        fields["status"] = BookingStatus.PAID
+    return fields
+
+
+def _payment_unavailable(request: Request, booking_id: str):
+    """Degraded response: the booking is kept as pending with a link to retry payment."""
+    return templates.TemplateResponse(
+        "payment_result.html",
+        {"request": request, "booking_id": booking_id, "booking_data": None, "pi_id": "", "status": "unavailable"},
+        status_code=503,
+        headers={"Retry-After": "30"},
+    )
+
+
+def _book_key(request: Request, client_key: str, form_data: dict) -> tuple[str, float]:
+    """Idempotency key and TTL for a booking submission.
+
+    A client key (form field or ``Idempotency-Key`` header) is combined with
+    the form contents, so an edited resubmission is a new booking. Without
+    one, identical forms within BOOK_DEDUP_WINDOW count as one submission.
+    """
+    client_key = (client_key or request.headers.get("idempotency-key") or "").strip()[:128]
+    fingerprint = json.dumps([
+        form_data["name"].strip().lower(), "".join(ch for ch in form_data["phone"] if ch.isdigit()),
+        form_data["tickets"], form_data["notes"].strip(),
+    ])
+    digest = hashlib.sha256(f"{client_key}|{fingerprint}".encode("utf-8")).hexdigest()
+    if client_key:
+        return f"book:{digest}", BOOK_IDEMPOTENCY_TTL
+    return f"book-form:{digest}", BOOK_DEDUP_WINDOW
+
+
+def _intent_outcome(booking: Booking, pi: dict | None) -> dict:
+    if not pi:
+        return {"kind": "unavailable", "booking_id": booking.booking_id}
+    if not booking.redirect_url:
+        return {"kind": "error", "booking_id": booking.booking_id, "status_code": 500,
+                "detail": "Payment intent created but no redirect URL."}
+    return {"kind": "redirect", "booking_id": booking.booking_id, "url": booking.redirect_url}
+
+
+def _time_left(deadline: float) -> float:
+    """Seconds of the request's Ziina budget still available."""
+    return max(0.0, deadline - time.monotonic())
+
+
+async def _create_booking(form_data: dict, key: str, ttl: float, deadline: float) -> dict:
+    """Create the booking and its payment intent; returns a replayable outcome.
+
+    The intent is requested as soon as the booking id is reserved, and the
+    row is written once afterwards with the intent attached, completing the
+    idempotency ``key`` with the outcome (kept ``ttl`` seconds) in the same
+    transaction. If the call fails (or the request is dropped mid-call) the
+    booking is still stored as pending, so /pay can finish it later.
+    """
+    booking = await run_blocking(new_booking, form_data)
+
+    if not has_ziina_configured():
+        logging.warning("Ziina not configured; booking saved as pending.")
+        outcome = {"kind": "unconfigured", "booking_id": booking.booking_id, "total_amount": booking.total_amount}
+        await run_blocking(insert_booking, booking, (key, outcome, ttl))
+        return outcome
+
+    pi = None
+    try:
+        pi = await acreate_payment_intent(
+            booking.total_amount, booking.booking_id, booking.name, budget=_time_left(deadline)
+        )
+    finally:
+        if pi:
+            booking = booking.with_changes(**_intent_fields(pi))
+        outcome = _intent_outcome(booking, pi)
+        await asyncio.shield(run_blocking(insert_booking, booking, (key, outcome, ttl)))
+
+    if not pi:
+        logging.warning(f"Payment intent for {booking.booking_id} failed; booking kept as pending.")
+    return outcome
+
+
+def _booking_response(request: Request, outcome: dict):
+    if outcome["kind"] == "error":
+        raise HTTPException(status_code=outcome["status_code"], detail=outcome["detail"])
+    if outcome["kind"] == "redirect":
+        return RedirectResponse(url=outcome["url"], status_code=303)
+    if outcome["kind"] == "unavailable":
+        return _payment_unavailable(request, outcome["booking_id"])
+    return HTMLResponse(
+        f"<h1>Booking Created</h1><p>Booking ID: {outcome['booking_id']}</p>"
+        f"<p>Total: {outcome['total_amount']:.2f} AED</p>"
+        "<p>Ziina payment not configured. Contact admin to complete payment.</p>"
+    )
+
+
+async def _await_replay(key: str, deadline: float) -> dict | None:
+    """Wait until ``deadline`` for an in-flight request with the same key to finish."""
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+        outcome = await run_blocking(idempotent_response, key)
+        if outcome is not None:
+            return outcome
+    return None
+
+
+@router.post("/book")
+async def book_ticket(
+    request: Request,
+    name: str = Form(...),
+    phone: str = Form(...),
+    tickets: int = Form(...),
+    notes: str = Form(""),
+    idempotency_key: str = Form(""),
+):
+    """Create booking and redirect to Ziina payment.
+
+    Replays of the same submission (double clicks, mobile retries) get the
+    first request's outcome without creating another booking or intent.
+    Ziina calls and replay waits share one ZIINA_REQUEST_BUDGET deadline.
+    """
+    deadline = time.monotonic() + ZIINA_REQUEST_BUDGET
+    if not name.strip() or not phone.strip():
+        raise HTTPException(status_code=400, detail="Name and phone required.")
     
-    # Update booking with payment_intent_id
-    df = load_bookings()
-    mask = df["booking_id"].astype(str) == str(booking_id)
-    if mask.any():
-        df.loc[mask, "payment_intent_id"] = payment_intent_id or ""
-        df.loc[mask, "payment_status"] = pi.get("status") or df.loc[mask, "payment_status"]
-        df.loc[mask, "redirect_url"] = redirect_url
-        if pi.get("status") == "completed":
-            df.loc[mask, "status"] = "paid"
-        save_bookings(df)
-    
-    if redirect_url:
-        return RedirectResponse(url=redirect_url, status_code=303)
-    else:
+    form_data = {"name": name, "phone": phone, "tickets": int(tickets), "notes": notes}
+    key, ttl = _book_key(request, idempotency_key, form_data)
+    earlier = await run_blocking(claim_idempotency_key, key, BOOK_CLAIM_LEASE)
+    if earlier is not None:
+        outcome = earlier["response"] if earlier["done"] else await _await_replay(key, deadline)
+        if outcome is None:
+            raise HTTPException(status_code=409, detail="This booking is still being processed.")
+        return _booking_response(request, outcome)
+
+    try:
+        outcome = await _create_booking(form_data, key, ttl, deadline)
+    except BaseException:
+        # Frees the key only if no booking was written for it
+        await asyncio.shield(run_blocking(release_idempotency_key, key))
+        raise
+    return _booking_response(request, outcome)
+
+
+@router.get("/pay/{booking_id}")
+async def retry_payment(request: Request, booking_id: str):
+    """Resume payment for a pending booking, creating an intent if needed.
+
+    The status check and a new intent share one ZIINA_REQUEST_BUDGET deadline.
+    """
+    deadline = time.monotonic() + ZIINA_REQUEST_BUDGET
+    booking = await run_blocking(get_booking, booking_id)
+    if booking is None:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if booking.is_paid:
+        return RedirectResponse(url=f"/ticket/{booking_id}", status_code=303)
+    if booking.status != BookingStatus.PENDING:
+        raise HTTPException(status_code=409, detail="Booking is no longer payable.")
+    if not has_ziina_configured():
+        return _payment_unavailable(request, booking_id)
+
+    # Reuse the existing intent while the customer can still complete it
+    if booking.payment_intent_id and booking.redirect_url:
+        pi = await aget_payment_intent(booking.payment_intent_id, budget=_time_left(deadline))
+        if pi and (pi.get("status") or "") not in TERMINAL_STATUSES:
+            return RedirectResponse(url=booking.redirect_url, status_code=303)
+
+    pi = await acreate_payment_intent(booking.total_amount, booking_id, booking.name, budget=_time_left(deadline))
+    if not pi:
+        return _payment_unavailable(request, booking_id)
+    fields = _intent_fields(pi)
+    await run_blocking(update_booking, booking_id, **fields)
+    if not fields["redirect_url"]:
         raise HTTPException(status_code=500, detail="Payment intent created but no redirect URL.")
+    return RedirectResponse(url=fields["redirect_url"], status_code=303)
 
 
 @router.get("/payment_result", response_class=HTMLResponse)
@@ -109,17 +279,12 @@ async def payment_result(request: Request, result: str = "", pi_id: str = ""):
     raw_pi = pi_id.strip()
     pi_id_norm = urllib.parse.unquote(raw_pi).strip().strip('{}\"')
     
-    df = load_bookings()
-    row = df[df["payment_intent_id"].astype(str) == pi_id_norm]
-    if row.empty and pi_id_norm:
-        row = df[df["payment_intent_id"].astype(str).str.contains(pi_id_norm, na=False)]
-    
-    booking_id = row["booking_id"].iloc[0] if not row.empty else None
-    booking_data = row.to_dict('records')[0] if not row.empty else None
+    booking_data = await run_blocking(find_booking_by_intent, raw_pi)
+    booking_id = booking_data.booking_id if booking_data else None
     
     pi_status = None
     if pi_id_norm:
-        pi = get_payment_intent(pi_id_norm)
+        pi = await aget_payment_intent(pi_id_norm, budget=ZIINA_REQUEST_BUDGET)
         if pi:
             pi_status = pi.get("status") or (pi.get("data") or {}).get("status")
             returned_id = pi.get("id") or (pi.get("data") or {}).get("id") or pi.get("payment_intent_id")
@@ -128,15 +293,12 @@ async def payment_result(request: Request, result: str = "", pi_id: str = ""):
                 if returned_id != pi_id_norm:
                     pi_id_norm = returned_id
             
-            if not row.empty:
-                mask = df.index == row.index[0]
-                if pi_status:
-                    df.loc[mask, "payment_status"] = pi_status
-                    if pi_status == "completed":
-                        df.loc[mask, "status"] = "paid"
-                    elif pi_status in ("failed", "canceled"):
-                        df.loc[mask, "status"] = "cancelled"
-                    save_bookings(df)
+            if booking_data and pi_status:
+                booking_data, changed = await run_blocking(
+                    apply_payment_status, booking_data.payment_intent_id, pi_status
+                )
+                if changed and booking_data.is_paid:
+                    ticket_renderer.prerender([booking_data.booking_id])
     
     final_status = pi_status or result
     
@@ -152,22 +314,44 @@ async def payment_result(request: Request, result: str = "", pi_id: str = ""):
     )
 
 
+# Registered before /ticket/{booking_id}, which would otherwise take "X.pdf" as an id
+@router.get("/ticket/{booking_id}.{fmt}")
+async def download_ticket_file(request: Request, booking_id: str, fmt: str):
+    """Return the ticket as a PDF or PNG for a paid booking."""
+    if fmt not in TICKET_FORMATS:
+        raise HTTPException(status_code=404, detail="Not found")
+    booking_data = await run_blocking(get_booking, booking_id)
+    if booking_data is None:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if not booking_data.is_paid:
+        raise HTTPException(status_code=403, detail="Ticket only available for paid bookings")
+    if not ticket_renderer.available:
+        raise HTTPException(status_code=503, detail="PDF/PNG tickets are not available right now")
+
+    headers = {"ETag": ticket_renderer.etag_for(booking_data, fmt), "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    try:
+        path = await ticket_renderer.get(booking_data, fmt)
+    except RenderQueueFull:
+        raise HTTPException(status_code=503, detail="Ticket is being prepared, please retry",
+                            headers={"Retry-After": "2"})
+    return FileResponse(
+        path, media_type=TICKET_FORMATS[fmt], headers=headers,
+        filename=f"snow-liwa-{booking_data.booking_id}.{fmt}", content_disposition_type="inline",
+    )
+
+
 @router.get("/ticket/{booking_id}", response_class=HTMLResponse)
-async def download_ticket(booking_id: str):
-    """Generate and return ticket HTML for a booking."""
-    from utils.ticket_generator import generate_ticket_html
-    
-    df = load_bookings()
-    row = df[df["booking_id"] == booking_id]
-    
-    if row.empty:
+async def download_ticket(request: Request, booking_id: str):
+    """Return the ticket HTML for a paid booking (ETag / 304 aware)."""
+    booking_data = await run_blocking(get_booking, booking_id)
+    if booking_data is None:
         raise HTTPException(status_code=404, detail="Booking not found")
     
-    booking_data = row.to_dict('records')[0]
-    
     # Only generate ticket for paid bookings
-    if booking_data.get("status") != "paid":
+    if not booking_data.is_paid:
         raise HTTPException(status_code=403, detail="Ticket only available for paid bookings")
     
-    ticket_html = generate_ticket_html(booking_data)
-    return HTMLResponse(content=ticket_html)
+    ticket = await run_blocking(render_ticket, booking_data)
+    return cached_response(request, ticket, cache_control="private, no-cache")
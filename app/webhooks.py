@@ -0,0 +1,65 @@
+"""Ziina webhook receiver: push-based payment status updates."""
+from __future__ import annotations
+import hashlib
+import hmac
+import json
+import logging
+from fastapi import APIRouter, HTTPException, Request
+from core.config import ZIINA_WEBHOOK_SECRET
+from core.runtime import run_blocking
+from services.intent_cache import intent_cache
+from services.ticket_render import ticket_renderer
+from utils.logic import apply_payment_status
+
+router = APIRouter()
+
+SIGNATURE_HEADER = "X-Hmac-Signature"
+HANDLED_EVENTS = ("payment_intent.status.updated",)
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    """Hex HMAC-SHA256 of the raw request body."""
+    return hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body: bytes, signature: str, secret: str = ZIINA_WEBHOOK_SECRET) -> bool:
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(body, secret), signature.strip().lower())
+
+
+@router.post("/webhooks/ziina")
+async def ziina_webhook(request: Request):
+    """Apply a payment-intent status event. Repeated deliveries are no-ops."""
+    if not ZIINA_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhook secret not configured.")
+    body = await request.body()
+    if not verify_signature(body, request.headers.get(SIGNATURE_HEADER, "")):
+        raise HTTPException(status_code=401, detail="Invalid signature.")
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON.")
+    if not isinstance(event, dict) or event.get("event") not in HANDLED_EVENTS:
+        return {"status": "ignored"}
+
+    intent = event.get("data") or {}
+    pi_id = str(intent.get("id") or "")
+    pi_status = intent.get("status")
+    if not pi_id or not pi_status:
+        raise HTTPException(status_code=400, detail="Event has no payment intent id/status.")
+
+    # The event carries the intent; let status lookups reuse it
+    intent_cache.put(pi_id, intent)
+    booking, changed = await run_blocking(apply_payment_status, pi_id, pi_status)
+    if booking is None:
+        # Not ours (or already purged); acknowledge so Ziina stops retrying
+        logging.warning(f"Ziina webhook for unknown intent {pi_id}")
+        return {"status": "unknown_intent"}
+    if changed and booking.is_paid:
+        ticket_renderer.prerender([booking.booking_id])
+    return {
+        "status": "applied" if changed else "unchanged",
+        "booking_id": booking.booking_id,
+        "booking_status": str(booking.status),
+    }
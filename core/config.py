@@ -13,16 +13,87 @@ except Exception:
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 BOOKINGS_FILE = DATA_DIR / "bookings.xlsx"
+BOOKINGS_DB = DATA_DIR / "bookings.db"
+BOOKINGS_JOURNAL = DATA_DIR / "bookings_journal.jsonl"
 SETTINGS_FILE = DATA_DIR / "settings.json"
+EXPORTS_DIR = DATA_DIR / "exports"
 ASSETS_DIR = BASE_DIR / "assets"
+# Precompressed copies of the assets (generated, not committed)
+ASSETS_BUILD_DIR = BASE_DIR / "build" / "assets"
+# Compiled Jinja templates shared by all workers
+TEMPLATE_CACHE_DIR = BASE_DIR / "build" / "jinja"
 PAGES_DIR = BASE_DIR / "pages"
+LANDING_HTML = BASE_DIR / "Fhdd" / "1.html"
 
 # Business constants
 TICKET_PRICE_AED = int(os.getenv("TICKET_PRICE_AED", "175"))
 ZIINA_API_BASE = os.getenv("ZIINA_API_BASE", "https://api-v2.ziina.com/api")
 
+# Ziina HTTP client: keep-alive pool size, timeouts (seconds), GET retries
+ZIINA_POOL_SIZE = int(os.getenv("ZIINA_POOL_SIZE", "20"))
+ZIINA_CONNECT_TIMEOUT = float(os.getenv("ZIINA_CONNECT_TIMEOUT", "3"))
+ZIINA_READ_TIMEOUT = float(os.getenv("ZIINA_READ_TIMEOUT", "10"))
+ZIINA_GET_RETRIES = int(os.getenv("ZIINA_GET_RETRIES", "2"))
+# Circuit breaker around Ziina: share of recent calls failing (or slower
+# than ZIINA_BREAKER_SLOW_SECONDS) that opens it, and seconds it stays open
+ZIINA_BREAKER_FAILURE_RATE = float(os.getenv("ZIINA_BREAKER_FAILURE_RATE", "0.5"))
+ZIINA_BREAKER_SLOW_SECONDS = float(os.getenv("ZIINA_BREAKER_SLOW_SECONDS", "5"))
+ZIINA_BREAKER_COOLDOWN = float(os.getenv("ZIINA_BREAKER_COOLDOWN", "30"))
+# Total seconds a customer request may spend waiting on Ziina
+ZIINA_REQUEST_BUDGET = float(os.getenv("ZIINA_REQUEST_BUDGET", "6"))
+# Parallel status checks during a payment sync
+ZIINA_SYNC_CONCURRENCY = int(os.getenv("ZIINA_SYNC_CONCURRENCY", "8"))
+# Seconds a non-terminal payment-intent status is reused before re-asking Ziina
+ZIINA_STATUS_TTL = float(os.getenv("ZIINA_STATUS_TTL", "5"))
+# Background reconciler: first re-check delay (doubles per check, 0 disables),
+# delay cap, and age after which a pending booking is no longer polled
+ZIINA_RECONCILE_INTERVAL = float(os.getenv("ZIINA_RECONCILE_INTERVAL", "15"))
+ZIINA_RECONCILE_MAX_INTERVAL = float(os.getenv("ZIINA_RECONCILE_MAX_INTERVAL", "900"))
+ZIINA_RECONCILE_HORIZON = float(os.getenv("ZIINA_RECONCILE_HORIZON", "172800"))
+# Shared secret Ziina signs webhook bodies with (HMAC-SHA256); webhooks are
+# rejected while it is unset
+ZIINA_WEBHOOK_SECRET = os.getenv("ZIINA_WEBHOOK_SECRET", "")
+
+# POST /book replay protection: how long a client-sent idempotency key is
+# remembered, and the window in which an identical keyless form counts as
+# a double submit
+BOOK_IDEMPOTENCY_TTL = float(os.getenv("BOOK_IDEMPOTENCY_TTL", "86400"))
+BOOK_DEDUP_WINDOW = float(os.getenv("BOOK_DEDUP_WINDOW", "120"))
+# Seconds an unfinished claim is held; a worker killed mid-request frees
+# the key for a retry after this long
+BOOK_CLAIM_LEASE = float(os.getenv("BOOK_CLAIM_LEASE", str(ZIINA_REQUEST_BUDGET + 10)))
+
+# Rendered ticket pages kept in memory per worker
+TICKET_CACHE_SIZE = int(os.getenv("TICKET_CACHE_SIZE", "512"))
+# PDF/PNG tickets: render processes per worker, renders allowed in flight
+# before downloads get a 503, where files are kept, and an optional TTF font
+TICKET_RENDER_WORKERS = int(os.getenv("TICKET_RENDER_WORKERS", "2"))
+TICKET_RENDER_QUEUE = int(os.getenv("TICKET_RENDER_QUEUE", "32"))
+TICKET_RENDER_DIR = DATA_DIR / "tickets"
+TICKET_FONT = os.getenv("TICKET_FONT", "")
+# Ticket QR codes: HMAC key for the signed token (a random one is kept in
+# data/ if unset), days a ticket stays valid after booking, and the QR cache
+TICKET_SIGNING_SECRET = os.getenv("TICKET_SIGNING_SECRET", "")
+TICKET_VALID_DAYS = int(os.getenv("TICKET_VALID_DAYS", "90"))
+QR_CACHE_DIR = DATA_DIR / "qr"
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", "2048"))
+
+# Seconds between refreshes of the bookings.xlsx snapshot from the store
+BOOKINGS_SNAPSHOT_INTERVAL = float(os.getenv("BOOKINGS_SNAPSHOT_INTERVAL", "60"))
+# Audit log (journal) size that starts a new segment, and old segments kept
+BOOKINGS_JOURNAL_MAX_BYTES = int(os.getenv("BOOKINGS_JOURNAL_MAX_BYTES", str(16 * 1024 * 1024)))
+BOOKINGS_JOURNAL_KEEP = int(os.getenv("BOOKINGS_JOURNAL_KEEP", "5"))
+
+# Month partitions of bookings kept in memory for point lookups
+BOOKING_PARTITIONS_CACHED = int(os.getenv("BOOKING_PARTITIONS_CACHED", "3"))
+
+# Threads available for store / file I/O dispatched from async handlers
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "8"))
+
 # Admin PIN
 ADMIN_PIN = os.getenv("ADMIN_PIN", "change_me")
+# Password of the gate scanners for /checkin (username "gate"); defaults to the admin PIN
+CHECKIN_PIN = os.getenv("CHECKIN_PIN", "") or ADMIN_PIN
 
 # External config
 
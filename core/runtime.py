@@ -0,0 +1,70 @@
+"""Async runtime helpers: bounded executor for blocking work and an
+event-loop lag probe."""
+from __future__ import annotations
+import asyncio
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+from core.config import BLOCKING_WORKERS
+
+T = TypeVar("T")
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+    return _executor
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking call on the bounded executor without stalling the loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a periodic sleeper.
+
+    Lag near zero means handlers are not blocking the loop; it is the number
+    to watch while payment calls are in flight.
+    """
+
+    def __init__(self, interval: float = 0.25, window: int = 240):
+        self.interval = interval
+        self.samples: deque[float] = deque(maxlen=window)
+        self.max_lag = 0.0
+
+    async def run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def stats(self) -> dict:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"samples": 0}
+        return {
+            "samples": len(ordered),
+            "last_ms": round(self.samples[-1] * 1000, 2),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
+
+
+loop_lag = LoopLagMonitor()
@@ -1,19 +1,61 @@
 """Snow Liwa FastAPI app - main entry point."""
 from __future__ import annotations
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from core.config import ASSETS_DIR
-from app.routes import router as app_router
+from core.config import BOOKINGS_SNAPSHOT_INTERVAL
+from core.runtime import loop_lag, shutdown_executor
+from app.assets import router as assets_router
+from app.checkin import router as checkin_router
+from app.routes import landing, router as app_router
+from app.webhooks import router as webhooks_router
 from admin.routes import router as admin_router
+from admin.export import router as export_router
+from services.reconciler import leadership, reconciler
+from services.ticket_render import ticket_renderer
+from services.ziina_client import aclose_client
+from utils.assets import manifest
+from utils.journal import run_snapshot_exporter
 
-app = FastAPI(title="Snow Liwa", version="1.0.0")
 
-# Mount static assets
-app.mount("/assets", StaticFiles(directory=str(ASSETS_DIR)), name="assets")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Refresh bookings.xlsx off the request path, in the leader worker only
+    stop = threading.Event()
+    snapshot_exporter = threading.Thread(
+        target=run_snapshot_exporter, args=(stop, BOOKINGS_SNAPSHOT_INTERVAL, leadership.try_lead),
+        name="bookings-snapshot", daemon=True,
+    )
+    snapshot_exporter.start()
+    # Fingerprint assets, then render the landing page against their URLs
+    await asyncio.to_thread(manifest)
+    await asyncio.to_thread(landing.load)
+    lag_probe = asyncio.create_task(loop_lag.run())
+    reconcile = asyncio.create_task(reconciler.run())
+    try:
+        yield
+    finally:
+        lag_probe.cancel()
+        reconcile.cancel()
+        await asyncio.gather(reconcile, return_exceptions=True)
+        await ticket_renderer.aclose()
+        await aclose_client()
+        stop.set()
+        await asyncio.to_thread(snapshot_exporter.join, 30)
+        leadership.resign()
+        shutdown_executor()
+
+
+app = FastAPI(title="Snow Liwa", version="1.0.0", lifespan=lifespan)
 
 # Include routers
+app.include_router(assets_router)
 app.include_router(app_router)
+app.include_router(webhooks_router)
+app.include_router(checkin_router)
 app.include_router(admin_router)
+app.include_router(export_router)
 
 
 @app.get("/health")
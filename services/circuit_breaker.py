@@ -0,0 +1,85 @@
+"""Circuit breaker for calls to an external provider.
+
+Closed: calls go through and outcomes are recorded in a rolling window.
+When enough of the window failed or was slow, the breaker opens and calls
+are refused immediately for ``cooldown`` seconds. It then goes half-open:
+a single probe call is let through, and its outcome closes the breaker
+again or re-opens it for another cooldown.
+"""
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5,
+                 failure_rate: float = 0.5, slow_call_seconds: float = 5.0,
+                 slow_rate: float = 0.5, cooldown: float = 30.0):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self._calls: deque[tuple[bool, bool]] = deque(maxlen=window)  # (failed, slow)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open, only one probe does."""
+        state = self.state
+        with self._lock:
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._trip()
+                return
+            self._calls.append((not ok, slow))
+            if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                n = len(self._calls)
+                failed = sum(f for f, _ in self._calls) / n
+                slowed = sum(s for _, s in self._calls) / n
+                if failed >= self.failure_rate or slowed >= self.slow_rate:
+                    self._trip()
+
+    def abandon(self) -> None:
+        """A call that was let through ended without an outcome (cancelled)."""
+        with self._lock:
+            self._probing = False
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self.trips += 1
+
+    def stats(self) -> dict:
+        return {"state": self.state, "trips": self.trips, "rejected": self.rejected}
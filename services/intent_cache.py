@@ -0,0 +1,127 @@
+"""Short-lived cache of Ziina payment intents with request coalescing.
+
+Customers refresh the payment result page while their bank confirms, and
+the admin sync and webhook paths ask about the same intents. Lookups go
+through one ``IntentCache`` per process:
+
+* non-terminal intents are cached for ``ttl`` seconds, terminal ones
+  (completed / failed / canceled) until evicted;
+* concurrent lookups of one intent share a single upstream GET, both for
+  threads (sync API) and for tasks on the event loop (async API);
+* failed lookups (``None``) are not cached.
+"""
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Optional
+from core.config import ZIINA_STATUS_TTL
+
+TERMINAL_STATUSES = frozenset({"completed", "failed", "canceled"})
+
+
+def _status(pi: dict) -> Optional[str]:
+    return pi.get("status") or (pi.get("data") or {}).get("status")
+
+
+class IntentCache:
+    def __init__(self, ttl: float = ZIINA_STATUS_TTL, max_entries: int = 4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._ainflight: dict[str, asyncio.Future] = {}
+        self.hits = self.misses = self.coalesced = 0
+
+    def _lookup(self, pi_id: str) -> Optional[dict]:
+        entry = self._entries.get(pi_id)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[pi_id]
+            return None
+        self._entries.move_to_end(pi_id)
+        return value
+
+    def put(self, pi_id: str, pi: Optional[dict]) -> None:
+        """Store a fetched (or webhook-pushed) intent."""
+        if not pi_id or not pi:
+            return
+        terminal = _status(pi) in TERMINAL_STATUSES
+        expires = float("inf") if terminal else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[pi_id] = (expires, pi)
+            self._entries.move_to_end(pi_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, pi_id: str) -> None:
+        with self._lock:
+            self._entries.pop(pi_id, None)
+
+    def get(self, pi_id: str, fetch: Callable[[str], Optional[dict]]) -> Optional[dict]:
+        """Cached intent, fetching it at most once across concurrent threads."""
+        with self._lock:
+            cached = self._lookup(pi_id)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            future = self._inflight.get(pi_id)
+            leader = future is None
+            if leader:
+                self.misses += 1
+                future = self._inflight[pi_id] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            pi = fetch(pi_id)
+            self.put(pi_id, pi)
+            future.set_result(pi)
+            return pi
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(pi_id, None)
+
+    async def aget(self, pi_id: str, fetch: Callable[[str], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """Async ``get``: concurrent tasks for one intent await one fetch."""
+        with self._lock:
+            cached = self._lookup(pi_id)
+            if cached is not None:
+                self.hits += 1
+                return cached
+        task = self._ainflight.get(pi_id)
+        if task is None:
+            self.misses += 1
+            task = self._ainflight[pi_id] = asyncio.ensure_future(self._afetch(pi_id, fetch))
+        else:
+            self.coalesced += 1
+        # shield: one impatient caller going away must not cancel the others
+        return await asyncio.shield(task)
+
+    async def _afetch(self, pi_id: str, fetch) -> Optional[dict]:
+        try:
+            pi = await fetch(pi_id)
+            self.put(pi_id, pi)
+            return pi
+        finally:
+            self._ainflight.pop(pi_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+
+intent_cache = IntentCache()
@@ -2,113 +2,110 @@
 No Streamlit dependency; everything is pure logic.
 """
 from __future__ import annotations
-import logging
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
-import requests
 import pandas as pd
-from core.config import get_ziina_config, ZIINA_API_BASE
-from utils.io import load_bookings, save_bookings
+from core.config import ZIINA_SYNC_CONCURRENCY
+from core.runtime import run_blocking
+from services.intent_cache import intent_cache
+from services.ticket_render import ticket_renderer
+from services.ziina_client import get_client
+from utils.io import load_bookings, pending_intents, update_bookings
+from utils.logic import payment_updates
+from utils.models import Booking
 
 # Public API ---------------------------------------------------------------
 
 def has_ziina_configured() -> bool:
-    access_token, _, _ = get_ziina_config()
-    if not access_token:
-        return False
-    if isinstance(access_token, str) and (
-        access_token.startswith("PUT_") 
-        or access_token.startswith("REPLACE_")
-        or access_token.startswith("YOUR_")
-    ):
-        return False
-    return True
+    return get_client().config.configured
 
 
 def create_payment_intent(amount_aed: float, booking_id: str, customer_name: str) -> Optional[dict]:
-    access_token, app_base_url, test_mode = get_ziina_config()
-    if not access_token:
-        logging.error("Ziina access token missing.")
-        return None
-    amount_fils = int(round(amount_aed * 100))
-    url = f"{ZIINA_API_BASE}/payment_intent"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    base_return = app_base_url.rstrip("/")
-    success_url = f"{base_return}/payment_result?result=success&pi_id={{PAYMENT_INTENT_ID}}"
-    cancel_url = f"{base_return}/payment_result?result=cancel&pi_id={{PAYMENT_INTENT_ID}}"
-    failure_url = f"{base_return}/payment_result?result=failure&pi_id={{PAYMENT_INTENT_ID}}"
-    payload = {
-        "amount": amount_fils,
-        "currency_code": "AED",
-        "message": f"Snow Liwa booking {booking_id} - {customer_name}",
-        "success_url": success_url,
-        "cancel_url": cancel_url,
-        "failure_url": failure_url,
-        "test": test_mode,
-    }
-    logging.info(f"[ZIINA] POST {url}")
-    try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=15)
-    except requests.RequestException as e:
-        logging.error(f"Ziina request error: {e}")
-        return None
-    if resp.status_code not in (200, 201):
-        logging.error(f"Ziina error status={resp.status_code} body={resp.text}")
-        return None
-    try:
-        return resp.json()
-    except Exception:
-        return None
+    return get_client().create_payment_intent(amount_aed, booking_id, customer_name)
 
 
 def get_payment_intent(pi_id: str) -> Optional[dict]:
-    access_token, _, _ = get_ziina_config()
-    if not access_token:
-        return None
-    url = f"{ZIINA_API_BASE}/payment_intent/{pi_id}"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    logging.info(f"[ZIINA] GET {url}")
-    try:
-        resp = requests.get(url, headers=headers, timeout=15)
-    except requests.RequestException as e:
-        logging.error(f"Ziina request error: {e}")
-        return None
-    if resp.status_code != 200:
-        logging.error(f"Ziina error status={resp.status_code} body={resp.text}")
-        return None
-    try:
-        return resp.json()
-    except Exception:
-        return None
+    """Intent by id, served from the shared short-TTL cache when fresh."""
+    return intent_cache.get(pi_id, get_client().get_payment_intent)
+
+
+# Async API (used by the FastAPI routes) --------------------------------------
+
+async def acreate_payment_intent(amount_aed: float, booking_id: str, customer_name: str,
+                                 budget: Optional[float] = None) -> Optional[dict]:
+    return await get_client().acreate_payment_intent(amount_aed, booking_id, customer_name, budget=budget)
+
+
+async def aget_payment_intent(pi_id: str, budget: Optional[float] = None) -> Optional[dict]:
+    """``budget`` caps the upstream call; coalesced callers share the first one's."""
+    return await intent_cache.aget(pi_id, functools.partial(get_client().aget_payment_intent, budget=budget))
 
 
 def get_payment_intent_status(pi_id: str) -> Optional[str]:
-    pi = get_payment_intent(pi_id)
+    return intent_status(get_payment_intent(pi_id))
+
+
+def intent_status(pi: Optional[dict]) -> Optional[str]:
     if not pi:
         return None
     return pi.get("status") or (pi.get("data") or {}).get("status")
 
 
-def sync_all_bookings(df: pd.DataFrame) -> pd.DataFrame:
-    """Update payment status for bookings with payment_intent_id."""
-    if not has_ziina_configured():
-        return df
-    updated = False
-    for idx, row in df.iterrows():
-        pi_id = str(row.get("payment_intent_id") or "").strip()
-        if not pi_id:
-            continue
-        status = get_payment_intent_status(pi_id)
+def plan_payment_updates(pending: list[Booking], statuses: list[Optional[str]]) -> tuple[list, int]:
+    """Turn fetched statuses into (booking_id, fields, version) updates; count failures.
+
+    The version is the one the plan was made from, so ``update_bookings``
+    skips bookings a webhook or ``/pay`` changed in the meantime.
+    """
+    updates, failed = [], 0
+    for booking, status in zip(pending, statuses):
         if not status:
+            failed += 1
             continue
-        mask = df.index == idx
-        if status == "completed":
-            df.loc[mask, "status"] = "paid"
-            df.loc[mask, "payment_status"] = status
-            updated = True
-        elif status in ("failed", "canceled"):
-            df.loc[mask, "status"] = "cancelled"
-            df.loc[mask, "payment_status"] = status
-            updated = True
-    if updated:
-        save_bookings(df)
-    return df
+        fields = payment_updates(booking, status)
+        if fields:
+            updates.append((booking.booking_id, fields, booking.version))
+    return updates, failed
+
+
+def sync_pending_bookings(concurrency: int = ZIINA_SYNC_CONCURRENCY) -> dict:
+    """Check every pending booking's intent with bounded concurrency, apply
+    all changes in one transaction, and return a summary."""
+    if not has_ziina_configured():
+        return {"checked": 0, "changed": 0, "failed": 0}
+    pending = pending_intents()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        statuses = list(pool.map(get_payment_intent_status, [b.payment_intent_id for b in pending]))
+    updates, failed = plan_payment_updates(pending, statuses)
+    changed = update_bookings(updates) if updates else 0
+    return {"checked": len(pending), "changed": changed, "failed": failed}
+
+
+async def async_sync_pending_bookings(concurrency: int = ZIINA_SYNC_CONCURRENCY) -> dict:
+    """Async variant of sync_pending_bookings for the FastAPI routes."""
+    if not has_ziina_configured():
+        return {"checked": 0, "changed": 0, "failed": 0}
+    pending = await run_blocking(pending_intents)
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch(booking: Booking) -> Optional[str]:
+        async with sem:
+            return intent_status(await aget_payment_intent(booking.payment_intent_id))
+
+    statuses = await asyncio.gather(*(fetch(b) for b in pending))
+    updates, failed = plan_payment_updates(pending, statuses)
+    changed = await run_blocking(update_bookings, updates) if updates else 0
+    ticket_renderer.prerender_updates(updates)
+    return {"checked": len(pending), "changed": changed, "failed": failed}
+
+
+def sync_all_bookings(df: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Sync pending bookings with Ziina and return the refreshed bookings.
+
+    ``df`` is accepted for backwards compatibility; only pending bookings
+    with a payment intent are checked.
+    """
+    sync_pending_bookings()
+    return load_bookings()
@@ -0,0 +1,144 @@
+"""Background reconciliation of pending bookings against Ziina.
+
+Webhooks deliver most status changes; the reconciler catches the ones
+that never arrive. It runs as a task in the app lifespan, but only one
+worker process polls at a time: ``leadership`` is a non-blocking lock on
+``data/.reconciler.lock``, which the OS frees if the leader dies, and
+followers keep trying to take it over. The bookings.xlsx snapshot exporter
+runs under the same leadership.
+
+Each pending intent is checked as soon as it is seen, then again after
+exponentially growing delays (``ZIINA_RECONCILE_INTERVAL`` doubling up to
+``ZIINA_RECONCILE_MAX_INTERVAL``). Bookings older than
+``ZIINA_RECONCILE_HORIZON`` are no longer polled; ``/admin/sync`` still
+covers them.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from core.config import (
+    DATA_DIR, ZIINA_RECONCILE_HORIZON, ZIINA_RECONCILE_INTERVAL, ZIINA_RECONCILE_MAX_INTERVAL,
+    ZIINA_SYNC_CONCURRENCY,
+)
+from core.runtime import run_blocking
+from services.payments_ziina import (
+    aget_payment_intent, has_ziina_configured, intent_status, plan_payment_updates,
+)
+from services.ticket_render import ticket_renderer
+from utils.io import pending_intents, update_bookings
+from utils.locks import Leadership
+from utils.models import Booking
+
+LOCK_FILE = DATA_DIR / ".reconciler.lock"
+leadership = Leadership(LOCK_FILE)
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _age_seconds(booking: Booking, now: datetime) -> float:
+    try:
+        created = datetime.strptime(booking.created_at, _TIME_FORMAT)
+    except (TypeError, ValueError):
+        return 0.0
+    return max(0.0, (now - created).total_seconds())
+
+
+class Reconciler:
+    def __init__(self, interval: float = ZIINA_RECONCILE_INTERVAL,
+                 max_interval: float = ZIINA_RECONCILE_MAX_INTERVAL,
+                 horizon: float = ZIINA_RECONCILE_HORIZON,
+                 concurrency: int = ZIINA_SYNC_CONCURRENCY):
+        self.interval = interval
+        self.max_interval = max_interval
+        self.horizon = horizon
+        self.concurrency = max(1, concurrency)
+        # booking_id -> (checks so far, monotonic time of next check)
+        self._schedule: dict[str, tuple[int, float]] = {}
+        self.checked = self.changed = self.failed = 0
+        self.last_run: Optional[float] = None
+        self.pending = 0
+        self.oldest_pending_age = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        return leadership.is_leader
+
+    def _delay(self, checks: int) -> float:
+        return min(self.max_interval, self.interval * (2 ** checks))
+
+    def _due(self, pending: list[Booking], now: datetime) -> list[Booking]:
+        """Pending bookings whose next check is due; updates the schedule."""
+        mono = time.monotonic()
+        live = {b.booking_id for b in pending}
+        for booking_id in list(self._schedule):
+            if booking_id not in live:
+                del self._schedule[booking_id]
+        due = []
+        for booking in pending:
+            entry = self._schedule.get(booking.booking_id)
+            if entry is None:
+                # First sighting (new booking or new leader): check now, then
+                # continue the backoff as if it had been polled since creation
+                age = _age_seconds(booking, now)
+                checks = int(math.log2(max(1.0, age / self.interval))) if self.interval else 0
+                entry = (checks, mono)
+            checks, next_at = entry
+            if next_at <= mono:
+                due.append(booking)
+                entry = (checks + 1, mono + self._delay(checks))
+            self._schedule[booking.booking_id] = entry
+        return due
+
+    async def reconcile_once(self) -> dict:
+        """One pass over the pending bookings that are due for a check."""
+        now = datetime.now()
+        since = (now - timedelta(seconds=self.horizon)).strftime(_TIME_FORMAT)
+        pending = await run_blocking(pending_intents, since)
+        self.pending = len(pending)
+        self.oldest_pending_age = _age_seconds(pending[0], now) if pending else 0.0
+        due = self._due(pending, now)
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(booking: Booking) -> Optional[str]:
+            async with sem:
+                return intent_status(await aget_payment_intent(booking.payment_intent_id))
+
+        statuses = await asyncio.gather(*(fetch(b) for b in due))
+        updates, failed = plan_payment_updates(due, statuses)
+        changed = await run_blocking(update_bookings, updates) if updates else 0
+        ticket_renderer.prerender_updates(updates)
+        self.checked += len(due)
+        self.changed += changed
+        self.failed += failed
+        self.last_run = time.time()
+        return {"checked": len(due), "changed": changed, "failed": failed}
+
+    async def run(self) -> None:
+        """Lifespan task: lead if possible, reconcile every ``interval``."""
+        if self.interval <= 0:
+            return
+        while True:
+            if has_ziina_configured() and await run_blocking(leadership.try_lead):
+                try:
+                    await self.reconcile_once()
+                except Exception as e:
+                    logging.error(f"Payment reconciliation failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "leader": self.is_leader,
+            "pending": self.pending,
+            "tracked": len(self._schedule),
+            "oldest_pending_age_s": round(self.oldest_pending_age, 1),
+            "checked": self.checked,
+            "changed": self.changed,
+            "failed": self.failed,
+            "last_run": self.last_run,
+        }
+
+
+reconciler = Reconciler()
@@ -0,0 +1,193 @@
+"""PDF / PNG tickets, rendered in worker processes and cached on disk.
+
+Drawing a ticket is CPU-bound, so it runs in a process pool and never on
+the API worker's event loop or its thread pool. Each file is written once
+to ``TICKET_RENDER_DIR`` as ``<booking_id>-<version>-<layout>-<token>.<fmt>``,
+where ``<token>`` fingerprints the embedded QR token, so any change to a
+booking, the layout or the signing key gives it a new file. Files of older
+booking versions are removed once a newer one is stored.
+
+Renders in flight are bounded by ``TICKET_RENDER_QUEUE``: past that,
+customer requests get a 503 with ``Retry-After`` instead of piling up.
+Bookings are pre-rendered in the background when they become paid, using
+at most half the queue so customers always have room.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterable, Optional
+from core.config import TICKET_FONT, TICKET_RENDER_DIR, TICKET_RENDER_QUEUE, TICKET_RENDER_WORKERS
+from core.runtime import run_blocking
+from utils.io import get_booking
+from utils.models import Booking, BookingStatus
+from utils.ticket_generator import ticket_context
+from utils.ticket_image import FORMATS, LAYOUT_VERSION, PIL_AVAILABLE, render_timed
+from utils.ticket_qr import qr_code
+from utils.ticket_tokens import ticket_token
+
+
+class RenderQueueFull(Exception):
+    """Too many ticket renders in flight; try again shortly."""
+
+
+def _token_tag(booking: Booking) -> str:
+    """Short fingerprint of the QR token drawn on the ticket."""
+    return hashlib.sha256((ticket_token(booking) or "").encode("utf-8")).hexdigest()[:8]
+
+
+def _store(path: Path, data: bytes, booking_id: str, version: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Another worker may be storing the same ticket right now
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+    # Older versions of the same ticket are never served again; files of this
+    # or a newer version may belong to another worker
+    for old in path.parent.glob(f"{booking_id}-*{path.suffix}"):
+        parts = old.stem.rsplit("-", 3)
+        if len(parts) == 4 and parts[0] == booking_id and parts[1].isdigit() and int(parts[1]) < version:
+            old.unlink(missing_ok=True)
+
+
+class TicketRenderer:
+    def __init__(self, workers: int = TICKET_RENDER_WORKERS, max_queue: int = TICKET_RENDER_QUEUE,
+                 cache_dir: Path = TICKET_RENDER_DIR, font_path: Optional[str] = TICKET_FONT or None):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.cache_dir = cache_dir
+        self.font_path = font_path
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._background: set[asyncio.Task] = set()
+        self.hits = self.rendered = self.failed = self.rejected = self.prerender_skipped = 0
+        self.render_seconds: deque[float] = deque(maxlen=200)
+        self.wait_seconds: deque[float] = deque(maxlen=200)
+
+    @property
+    def available(self) -> bool:
+        return PIL_AVAILABLE
+
+    def path_for(self, booking: Booking, fmt: str) -> Path:
+        return self.cache_dir / f"{booking.booking_id}-{booking.version}-{LAYOUT_VERSION}-{_token_tag(booking)}.{fmt}"
+
+    def etag_for(self, booking: Booking, fmt: str) -> str:
+        key = f"{booking.booking_id}\0{booking.version}\0{LAYOUT_VERSION}\0{_token_tag(booking)}\0{fmt}"
+        return f'"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: workers must not inherit the parent's threads, sockets or SQLite handles
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def get(self, booking: Booking, fmt: str) -> Path:
+        """Path of the rendered ticket, rendering it first if needed.
+
+        Raises RenderQueueFull when ``max_queue`` renders are already in flight.
+        """
+        path = self.path_for(booking, fmt)
+        if await run_blocking(path.exists):
+            self.hits += 1
+            return path
+        key = path.name
+        future = self._inflight.get(key)
+        if future is None:
+            if len(self._inflight) >= self.max_queue:
+                self.rejected += 1
+                raise RenderQueueFull()
+            future = asyncio.ensure_future(self._render(booking, fmt, path))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A disconnecting client must not cancel a render others may be waiting on
+        return await asyncio.shield(future)
+
+    async def _render(self, booking: Booking, fmt: str, path: Path) -> Path:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            data, seconds = await loop.run_in_executor(
+                self._get_pool(), render_timed, ticket_context(booking), fmt, self.font_path
+            )
+            await run_blocking(_store, path, data, booking.booking_id, booking.version)
+        except BrokenProcessPool:
+            # A worker died (OOM, crash); start a fresh pool for the next render
+            self.failed += 1
+            self._pool = None
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        self.rendered += 1
+        self.render_seconds.append(seconds)
+        self.wait_seconds.append(max(0.0, time.perf_counter() - start - seconds))
+        return path
+
+    def prerender(self, booking_ids: Iterable[str]) -> None:
+        """Render every format of these bookings in the background if they are paid."""
+        if not self.available:
+            return
+        loop = asyncio.get_running_loop()
+        for booking_id in booking_ids:
+            task = loop.create_task(self._prerender(booking_id))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def prerender_updates(self, updates: list[tuple[str, dict, Optional[int]]]) -> None:
+        """``prerender`` the bookings a batch of updates marks paid."""
+        self.prerender(b for b, fields, _ in updates if fields.get("status") == BookingStatus.PAID)
+
+    async def _prerender(self, booking_id: str) -> None:
+        booking = await run_blocking(get_booking, booking_id)
+        if booking is None or not booking.is_paid:
+            return
+        # The HTML ticket's QR; the PNG one is made by the render process
+        await run_blocking(qr_code, ticket_token(booking), "svg")
+        for fmt in FORMATS:
+            if len(self._inflight) >= self.max_queue // 2:
+                self.prerender_skipped += 1
+                continue  # rendered on first download instead
+            try:
+                await self.get(booking, fmt)
+            except Exception as e:
+                logging.error(f"Pre-rendering {fmt} ticket for {booking_id} failed: {e}")
+
+    async def aclose(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        def ms(samples, q):
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1) if ordered else None
+
+        return {
+            "available": self.available,
+            "workers": self.workers,
+            "in_flight": len(self._inflight),
+            "max_queue": self.max_queue,
+            "disk_hits": self.hits,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "prerender_skipped": self.prerender_skipped,
+            "render_ms_p50": ms(self.render_seconds, 0.5),
+            "render_ms_p95": ms(self.render_seconds, 0.95),
+            "queue_wait_ms_p95": ms(self.wait_seconds, 0.95),
+        }
+
+
+ticket_renderer = TicketRenderer()
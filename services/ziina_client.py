@@ -0,0 +1,280 @@
+"""Pooled HTTP client for the Ziina API.
+
+One ``ZiinaClient`` per process holds keep-alive connection pools (sync for
+Streamlit / background threads, async for the FastAPI routes), the Ziina
+config read once from the environment, split connect/read timeouts, and
+jittered retries for idempotent GETs.
+
+All calls go through a circuit breaker, so while Ziina is failing or slow
+they return ``None`` at once instead of tying up workers, and accept an
+optional ``budget`` (seconds) capping the whole call including retries.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+import httpx
+from core.config import (
+    ZIINA_API_BASE, ZIINA_CONNECT_TIMEOUT, ZIINA_READ_TIMEOUT, ZIINA_POOL_SIZE,
+    ZIINA_GET_RETRIES, ZIINA_BREAKER_COOLDOWN, ZIINA_BREAKER_FAILURE_RATE,
+    ZIINA_BREAKER_SLOW_SECONDS, get_ziina_config,
+)
+from services.circuit_breaker import CircuitBreaker
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Statuses worth retrying on an idempotent request
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+_BACKOFF_BASE = 0.2
+_BACKOFF_CAP = 2.0
+
+
+@dataclass(frozen=True)
+class ZiinaConfig:
+    access_token: Optional[str]
+    app_base_url: str
+    test_mode: bool
+    api_base: str = ZIINA_API_BASE
+
+    @classmethod
+    def from_env(cls) -> "ZiinaConfig":
+        access_token, app_base_url, test_mode = get_ziina_config()
+        return cls(access_token, app_base_url, test_mode)
+
+    @property
+    def configured(self) -> bool:
+        token = self.access_token
+        if not token:
+            return False
+        return not token.startswith(("PUT_", "REPLACE_", "YOUR_"))
+
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * (2 ** attempt)))
+
+
+def _parse_response(resp: httpx.Response, ok_statuses: tuple) -> Optional[dict]:
+    if resp.status_code not in ok_statuses:
+        logging.error(f"Ziina error status={resp.status_code} body={resp.text}")
+        return None
+    try:
+        return resp.json()
+    except Exception:
+        return None
+
+
+class ZiinaClient:
+    def __init__(self, config: Optional[ZiinaConfig] = None, pool_size: int = ZIINA_POOL_SIZE,
+                 connect_timeout: float = ZIINA_CONNECT_TIMEOUT, read_timeout: float = ZIINA_READ_TIMEOUT,
+                 get_retries: int = ZIINA_GET_RETRIES):
+        self.config = config or ZiinaConfig.from_env()
+        self.get_retries = get_retries
+        self.breaker = CircuitBreaker(
+            "ziina", failure_rate=ZIINA_BREAKER_FAILURE_RATE,
+            slow_call_seconds=ZIINA_BREAKER_SLOW_SECONDS, cooldown=ZIINA_BREAKER_COOLDOWN,
+        )
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._limits = httpx.Limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=60,
+        )
+        self._timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._lock = threading.Lock()
+        self._sync: Optional[httpx.Client] = None
+        self._async: Optional[httpx.AsyncClient] = None
+
+    # Connection pools ------------------------------------------------------
+
+    def _client_kwargs(self) -> dict:
+        return {
+            "base_url": self.config.api_base.rstrip("/") + "/",
+            "headers": {"Authorization": f"Bearer {self.config.access_token}"},
+            "limits": self._limits,
+            "timeout": self._timeout,
+            "http2": HTTP2_AVAILABLE,
+        }
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync is None or self._sync.is_closed:
+                self._sync = httpx.Client(**self._client_kwargs())
+            return self._sync
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async is None or self._async.is_closed:
+            self._async = httpx.AsyncClient(**self._client_kwargs())
+        return self._async
+
+    def close(self) -> None:
+        if self._sync is not None:
+            self._sync.close()
+            self._sync = None
+
+    async def aclose(self) -> None:
+        if self._async is not None:
+            await self._async.aclose()
+            self._async = None
+        self.close()
+
+    # Requests ----------------------------------------------------------------
+
+    def intent_payload(self, amount_aed: float, booking_id: str, customer_name: str) -> dict:
+        base_return = self.config.app_base_url.rstrip("/")
+        return {
+            "amount": int(round(amount_aed * 100)),
+            "currency_code": "AED",
+            "message": f"Snow Liwa booking {booking_id} - {customer_name}",
+            "success_url": f"{base_return}/payment_result?result=success&pi_id={{PAYMENT_INTENT_ID}}",
+            "cancel_url": f"{base_return}/payment_result?result=cancel&pi_id={{PAYMENT_INTENT_ID}}",
+            "failure_url": f"{base_return}/payment_result?result=failure&pi_id={{PAYMENT_INTENT_ID}}",
+            "test": self.config.test_mode,
+        }
+
+    def _deadline(self, budget: Optional[float]) -> Optional[float]:
+        return None if budget is None else time.monotonic() + budget
+
+    def _attempt_timeout(self, deadline: Optional[float]) -> Optional[httpx.Timeout]:
+        """Per-attempt timeout: the configured one, cut to what the budget has left."""
+        if deadline is None:
+            return self._timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        return httpx.Timeout(min(self._read_timeout, remaining), connect=min(self._connect_timeout, remaining))
+
+    def _request(self, method: str, path: str, ok_statuses: tuple, retries: int = 0,
+                 budget: Optional[float] = None, **kwargs) -> Optional[dict]:
+        deadline = self._deadline(budget)
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            timeout = self._attempt_timeout(deadline)
+            if timeout is None:
+                logging.error(f"Ziina {method} {path}: time budget exhausted")
+                return None
+            if not self.breaker.allow():
+                logging.warning(f"Ziina {method} {path}: circuit open, not calling")
+                return None
+            start = time.monotonic()
+            try:
+                resp = self.sync_client.request(method, path, timeout=timeout, **kwargs)
+            except httpx.TransportError as e:
+                self.breaker.record(False, time.monotonic() - start)
+                if last:
+                    logging.error(f"Ziina request error: {e!r}")
+                    return None
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            else:
+                self.breaker.record(resp.status_code not in _RETRY_STATUSES, time.monotonic() - start)
+                if resp.status_code not in _RETRY_STATUSES or last:
+                    return _parse_response(resp, ok_statuses)
+            pause = _backoff(attempt)
+            if deadline is not None and time.monotonic() + pause >= deadline:
+                logging.error(f"Ziina {method} {path}: time budget exhausted")
+                return None
+            time.sleep(pause)
+        return None
+
+    async def _arequest(self, method: str, path: str, ok_statuses: tuple, retries: int = 0,
+                        budget: Optional[float] = None, **kwargs) -> Optional[dict]:
+        deadline = self._deadline(budget)
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            timeout = self._attempt_timeout(deadline)
+            if timeout is None:
+                logging.error(f"Ziina {method} {path}: time budget exhausted")
+                return None
+            if not self.breaker.allow():
+                logging.warning(f"Ziina {method} {path}: circuit open, not calling")
+                return None
+            start = time.monotonic()
+            try:
+                resp = await self.async_client.request(method, path, timeout=timeout, **kwargs)
+            except httpx.TransportError as e:
+                self.breaker.record(False, time.monotonic() - start)
+                if last:
+                    logging.error(f"Ziina request error: {e!r}")
+                    return None
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            else:
+                self.breaker.record(resp.status_code not in _RETRY_STATUSES, time.monotonic() - start)
+                if resp.status_code not in _RETRY_STATUSES or last:
+                    return _parse_response(resp, ok_statuses)
+            pause = _backoff(attempt)
+            if deadline is not None and time.monotonic() + pause >= deadline:
+                logging.error(f"Ziina {method} {path}: time budget exhausted")
+                return None
+            await asyncio.sleep(pause)
+        return None
+
+    def create_payment_intent(self, amount_aed: float, booking_id: str, customer_name: str,
+                              budget: Optional[float] = None) -> Optional[dict]:
+        if not self.config.access_token:
+            logging.error("Ziina access token missing.")
+            return None
+        logging.info("[ZIINA] POST payment_intent")
+        return self._request(
+            "POST", "payment_intent", (200, 201), budget=budget,
+            json=self.intent_payload(amount_aed, booking_id, customer_name),
+        )
+
+    async def acreate_payment_intent(self, amount_aed: float, booking_id: str, customer_name: str,
+                                     budget: Optional[float] = None) -> Optional[dict]:
+        if not self.config.access_token:
+            logging.error("Ziina access token missing.")
+            return None
+        logging.info("[ZIINA] POST payment_intent")
+        return await self._arequest(
+            "POST", "payment_intent", (200, 201), budget=budget,
+            json=self.intent_payload(amount_aed, booking_id, customer_name),
+        )
+
+    def get_payment_intent(self, pi_id: str, budget: Optional[float] = None) -> Optional[dict]:
+        if not self.config.access_token:
+            return None
+        logging.info(f"[ZIINA] GET payment_intent/{pi_id}")
+        return self._request("GET", f"payment_intent/{pi_id}", (200,), retries=self.get_retries, budget=budget)
+
+    async def aget_payment_intent(self, pi_id: str, budget: Optional[float] = None) -> Optional[dict]:
+        if not self.config.access_token:
+            return None
+        logging.info(f"[ZIINA] GET payment_intent/{pi_id}")
+        return await self._arequest(
+            "GET", f"payment_intent/{pi_id}", (200,), retries=self.get_retries, budget=budget,
+        )
+
+
+_client: Optional[ZiinaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> ZiinaClient:
+    """Process-wide client, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ZiinaClient()
+        return _client
+
+
+async def aclose_client() -> None:
+    """Close the process-wide client's pools (app shutdown)."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.aclose()
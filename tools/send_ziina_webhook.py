@@ -0,0 +1,65 @@
+"""Post a signed Ziina payment-intent webhook to a local app.
+
+Stands in for Ziina when testing /webhooks/ziina:
+
+    python tools/send_ziina_webhook.py PI_ID completed
+    python tools/send_ziina_webhook.py PI_ID failed --repeat 3
+    python tools/send_ziina_webhook.py PI_ID completed --bad-signature
+
+The secret defaults to ZIINA_WEBHOOK_SECRET from the environment / .env.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import httpx
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except Exception:
+    pass
+
+
+def build_event(pi_id: str, status: str, amount: int) -> dict:
+    return {
+        "event": "payment_intent.status.updated",
+        "data": {"id": pi_id, "status": status, "amount": amount, "currency_code": "AED"},
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pi_id", help="payment intent id stored on the booking")
+    parser.add_argument("status", nargs="?", default="completed",
+                        help="intent status, e.g. completed / failed / canceled")
+    parser.add_argument("--url", default="http://localhost:8000/webhooks/ziina")
+    parser.add_argument("--secret", default=os.getenv("ZIINA_WEBHOOK_SECRET", ""))
+    parser.add_argument("--amount", type=int, default=17500, help="amount in fils")
+    parser.add_argument("--repeat", type=int, default=1, help="deliver the same event N times")
+    parser.add_argument("--bad-signature", action="store_true", help="send a wrong signature")
+    args = parser.parse_args(argv)
+
+    if not args.secret:
+        parser.error("no secret: pass --secret or set ZIINA_WEBHOOK_SECRET")
+    body = json.dumps(build_event(args.pi_id, args.status, args.amount)).encode("utf-8")
+    signature = hmac.new(args.secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    if args.bad_signature:
+        signature = signature[::-1]
+
+    ok = True
+    with httpx.Client(timeout=10) as client:
+        for _ in range(max(1, args.repeat)):
+            resp = client.post(args.url, content=body, headers={
+                "Content-Type": "application/json", "X-Hmac-Signature": signature,
+            })
+            print(resp.status_code, resp.text)
+            ok = ok and resp.is_success
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""Local stand-in for the Ziina API, for load tests and fault drills.
+
+Implements the endpoints the app uses, plus a fake hosted payment page:
+
+    POST /api/payment_intent            create an intent
+    GET  /api/payment_intent/{id}       fetch it
+    GET  /hosted/{id}                   "customer" page: pay or cancel
+    GET  /hosted/{id}/{outcome}         complete / fail / cancel, then redirect
+                                        to the intent's success/failure/cancel
+                                        URL with {PAYMENT_INTENT_ID} filled in
+
+API calls are delayed by a log-normal latency (median / p99), and a share
+of them fail with 503 or hang past the client's timeout, per profile:
+
+    python tools/ziina_emulator.py --profile realistic --port 9000
+    ZIINA_API_BASE=http://127.0.0.1:9000/api python main.py
+
+Intents can also settle on their own (``--auto-complete SECONDS``, with
+``--fail-rate`` of them failing), and status changes can be pushed to the
+app as signed webhooks (``--webhook-url`` / ``--webhook-secret``).
+
+The profile can be switched while running:
+
+    curl -X POST localhost:9000/_emulator/profile -d '{"profile": "brownout"}'
+    curl localhost:9000/_emulator/stats
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, replace
+from typing import Optional
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+
+TERMINAL = ("completed", "failed", "canceled")
+
+
+@dataclass(frozen=True)
+class Profile:
+    median_ms: float = 5
+    p99_ms: float = 20
+    error_rate: float = 0.0     # share of calls answered 503
+    timeout_rate: float = 0.0   # share of calls that hang for hang_seconds
+    hang_seconds: float = 60
+
+    def latency(self, rng: random.Random) -> float:
+        """Seconds, log-normal with the given median and 99th percentile."""
+        if self.median_ms <= 0:
+            return 0.0
+        sigma = math.log(max(self.p99_ms, self.median_ms) / self.median_ms) / 2.326
+        return rng.lognormvariate(math.log(self.median_ms), sigma) / 1000
+
+
+PROFILES = {
+    "fast": Profile(),
+    "realistic": Profile(median_ms=250, p99_ms=1500, error_rate=0.01, timeout_rate=0.002),
+    "brownout": Profile(median_ms=1500, p99_ms=8000, error_rate=0.15, timeout_rate=0.05),
+    "outage": Profile(median_ms=50, p99_ms=200, error_rate=1.0),
+    "blackhole": Profile(timeout_rate=1.0),
+}
+
+
+class Emulator:
+    def __init__(self, profile: Profile, public_url: str, seed: Optional[int] = None,
+                 auto_complete: Optional[float] = None, fail_rate: float = 0.0,
+                 webhook_url: Optional[str] = None, webhook_secret: str = ""):
+        self.profile = profile
+        self.public_url = public_url.rstrip("/")
+        self.rng = random.Random(seed)
+        self.auto_complete = auto_complete
+        self.fail_rate = fail_rate
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.intents: dict[str, dict] = {}
+        self.created: dict[str, float] = {}
+        self.stats: Counter = Counter()
+
+    async def delay_or_fault(self, endpoint: str) -> None:
+        """Apply the current profile to one API call."""
+        self.stats[f"{endpoint}.calls"] += 1
+        p = self.profile
+        roll = self.rng.random()
+        if roll < p.timeout_rate:
+            self.stats[f"{endpoint}.timeouts"] += 1
+            await asyncio.sleep(p.hang_seconds)
+        else:
+            await asyncio.sleep(p.latency(self.rng))
+        if roll >= p.timeout_rate and self.rng.random() < p.error_rate:
+            self.stats[f"{endpoint}.errors"] += 1
+            raise HTTPException(status_code=503, detail="emulated provider error")
+
+    def settle(self, intent: dict) -> None:
+        """Auto-complete (or fail) an intent once it is old enough."""
+        if self.auto_complete is None or intent["status"] in TERMINAL:
+            return
+        if time.monotonic() - self.created[intent["id"]] >= self.auto_complete:
+            self.set_status(intent, "failed" if self.rng.random() < self.fail_rate else "completed")
+
+    def set_status(self, intent: dict, status: str) -> None:
+        if intent["status"] == status:
+            return
+        intent["status"] = status
+        self.stats[f"status.{status}"] += 1
+        if self.webhook_url and self.webhook_secret:
+            asyncio.get_running_loop().create_task(self.send_webhook(intent))
+
+    async def send_webhook(self, intent: dict) -> None:
+        body = json.dumps({"event": "payment_intent.status.updated", "data": intent}).encode("utf-8")
+        signature = hmac.new(self.webhook_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                resp = await client.post(self.webhook_url, content=body, headers={
+                    "Content-Type": "application/json", "X-Hmac-Signature": signature,
+                })
+            self.stats[f"webhook.{resp.status_code}"] += 1
+        except httpx.HTTPError:
+            self.stats["webhook.error"] += 1
+
+
+def create_app(emulator: Emulator) -> FastAPI:
+    app = FastAPI(title="Ziina emulator")
+
+    def lookup(intent_id: str) -> dict:
+        intent = emulator.intents.get(intent_id)
+        if intent is None:
+            raise HTTPException(status_code=404, detail="payment intent not found")
+        return intent
+
+    @app.post("/api/payment_intent", status_code=201)
+    async def create_intent(request: Request):
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            raise HTTPException(status_code=401, detail="missing bearer token")
+        await emulator.delay_or_fault("create")
+        payload = await request.json()
+        if not isinstance(payload.get("amount"), int) or payload["amount"] <= 0:
+            raise HTTPException(status_code=400, detail="amount must be a positive integer (fils)")
+        intent_id = str(uuid.uuid4())
+        intent = {
+            "id": intent_id,
+            "amount": payload["amount"],
+            "currency_code": payload.get("currency_code", "AED"),
+            "message": payload.get("message"),
+            "status": "requires_payment_instrument",
+            "redirect_url": f"{emulator.public_url}/hosted/{intent_id}",
+            "success_url": payload.get("success_url"),
+            "cancel_url": payload.get("cancel_url"),
+            "failure_url": payload.get("failure_url"),
+            "test": bool(payload.get("test", True)),
+            "created_at": str(int(time.time() * 1000)),
+        }
+        emulator.intents[intent_id] = intent
+        emulator.created[intent_id] = time.monotonic()
+        return intent
+
+    @app.get("/api/payment_intent/{intent_id}")
+    async def get_intent(intent_id: str):
+        await emulator.delay_or_fault("get")
+        intent = lookup(intent_id)
+        emulator.settle(intent)
+        return intent
+
+    @app.get("/hosted/{intent_id}", response_class=HTMLResponse)
+    async def hosted_page(intent_id: str):
+        intent = lookup(intent_id)
+        return (
+            f"<h1>Ziina emulator</h1><p>{intent['message'] or ''}</p>"
+            f"<p>{intent['amount'] / 100:.2f} {intent['currency_code']} &middot; {intent['status']}</p>"
+            f'<p><a href="/hosted/{intent_id}/complete">Pay</a> &middot; '
+            f'<a href="/hosted/{intent_id}/fail">Fail</a> &middot; '
+            f'<a href="/hosted/{intent_id}/cancel">Cancel</a></p>'
+        )
+
+    @app.get("/hosted/{intent_id}/{outcome}")
+    async def hosted_outcome(intent_id: str, outcome: str):
+        intent = lookup(intent_id)
+        status, url_key = {
+            "complete": ("completed", "success_url"),
+            "fail": ("failed", "failure_url"),
+            "cancel": ("canceled", "cancel_url"),
+        }.get(outcome, (None, None))
+        if status is None:
+            raise HTTPException(status_code=404, detail="unknown outcome")
+        emulator.set_status(intent, status)
+        target = (intent.get(url_key) or "").replace("{PAYMENT_INTENT_ID}", intent_id)
+        if not target:
+            return JSONResponse(intent)
+        return RedirectResponse(url=target, status_code=303)
+
+    @app.post("/_emulator/profile")
+    async def set_profile(request: Request):
+        body = await request.json()
+        base = PROFILES.get(body.pop("profile", None), emulator.profile)
+        try:
+            emulator.profile = replace(base, **body)
+        except TypeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return asdict(emulator.profile)
+
+    @app.get("/_emulator/stats")
+    async def stats():
+        return {
+            "profile": asdict(emulator.profile),
+            "intents": len(emulator.intents),
+            "counters": dict(emulator.stats),
+        }
+
+    return app
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Local Ziina API emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--public-url", help="base URL customers reach the hosted page on "
+                        "(default http://HOST:PORT)")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast")
+    parser.add_argument("--median-ms", type=float, help="override the profile's median latency")
+    parser.add_argument("--p99-ms", type=float, help="override the profile's p99 latency")
+    parser.add_argument("--error-rate", type=float, help="override the share of 503 answers")
+    parser.add_argument("--timeout-rate", type=float, help="override the share of hung calls")
+    parser.add_argument("--auto-complete", type=float, metavar="SECONDS",
+                        help="settle intents this long after creation, on their next GET")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of auto-settled intents that fail")
+    parser.add_argument("--webhook-url", help="e.g. http://127.0.0.1:8000/webhooks/ziina")
+    parser.add_argument("--webhook-secret", default="")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    overrides = {
+        k: v for k, v in {
+            "median_ms": args.median_ms, "p99_ms": args.p99_ms,
+            "error_rate": args.error_rate, "timeout_rate": args.timeout_rate,
+        }.items() if v is not None
+    }
+    emulator = Emulator(
+        replace(PROFILES[args.profile], **overrides),
+        public_url=args.public_url or f"http://{args.host}:{args.port}",
+        seed=args.seed, auto_complete=args.auto_complete, fail_rate=args.fail_rate,
+        webhook_url=args.webhook_url, webhook_secret=args.webhook_secret,
+    )
+
+    import uvicorn
+    uvicorn.run(create_app(emulator), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
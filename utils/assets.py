@@ -0,0 +1,144 @@
+"""Static asset fingerprinting and precompression.
+
+Every file under ``assets/`` gets a content-hashed URL
+(``/assets/admin.css`` -> ``/assets/admin.3f2a1b9c0d12.css``) that can be
+cached forever, since any change to the file changes the URL. Text assets
+also get ``.gz`` / ``.br`` siblings in ``build/assets/``, written once
+(at image build via ``python -m utils.assets``, or on first startup) and
+reused while the content hash is unchanged.
+"""
+from __future__ import annotations
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from core.config import ASSETS_BUILD_DIR, ASSETS_DIR
+from utils.http_cache import BROTLI_AVAILABLE, brotli
+
+COMPRESSIBLE = {".css", ".js", ".mjs", ".svg", ".html", ".json", ".txt", ".xml", ".map", ".ico"}
+
+# Matches assets/... references in HTML/CSS: href="/assets/x.css", url(assets/y.png)
+_ASSET_REF = re.compile(r"""(?P<prefix>["'(=])(?P<slash>/?)assets/(?P<path>[^"'()\s?#]+)""")
+
+
+@dataclass(frozen=True, slots=True)
+class Asset:
+    logical: str        # path under assets/, e.g. "images/poster.jpg"
+    hashed: str         # e.g. "images/poster.0123456789ab.jpg"
+    digest: str
+    path: Path
+    media_type: str
+    gzip: Optional[Path] = None
+    br: Optional[Path] = None
+
+
+def _hashed_name(logical: str, digest: str) -> str:
+    p = Path(logical)
+    return str(p.with_name(f"{p.stem}.{digest[:12]}{p.suffix}")).replace("\\", "/")
+
+
+def _write_variant(target: Path, data: bytes, original_size: int) -> Optional[Path]:
+    """Write a compressed sibling unless it exists already or does not help."""
+    if len(data) >= original_size:
+        return None
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Workers starting together build the same files
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            tmp.replace(target)
+        except OSError:
+            if not target.exists():
+                raise  # the content is identical, so another writer's copy will do
+        finally:
+            tmp.unlink(missing_ok=True)
+    return target
+
+
+def _build_asset(path: Path, assets_dir: Path, build_dir: Path) -> Asset:
+    logical = path.relative_to(assets_dir).as_posix()
+    body = path.read_bytes()
+    digest = hashlib.sha256(body).hexdigest()
+    hashed = _hashed_name(logical, digest)
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    gz = br = None
+    if path.suffix.lower() in COMPRESSIBLE and body:
+        gz_target = build_dir / f"{hashed}.gz"
+        gz = gz_target if gz_target.exists() else _write_variant(
+            gz_target, gzip.compress(body, compresslevel=9, mtime=0), len(body)
+        )
+        if BROTLI_AVAILABLE:
+            br_target = build_dir / f"{hashed}.br"
+            br = br_target if br_target.exists() else _write_variant(
+                br_target, brotli.compress(body, quality=11), len(body)
+            )
+    return Asset(logical, hashed, digest, path, media_type, gz, br)
+
+
+def build_manifest(assets_dir: Path = ASSETS_DIR, build_dir: Path = ASSETS_BUILD_DIR) -> dict[str, Asset]:
+    """Fingerprint every asset (and precompress text ones), keyed by logical path."""
+    manifest = {}
+    if assets_dir.is_dir():
+        for path in sorted(assets_dir.rglob("*")):
+            if path.is_file() and not path.name.startswith("."):
+                asset = _build_asset(path, assets_dir, build_dir)
+                manifest[asset.logical] = asset
+    return manifest
+
+
+_manifest: Optional[dict[str, Asset]] = None
+_by_hashed: dict[str, Asset] = {}
+_lock = threading.Lock()
+
+
+def manifest() -> dict[str, Asset]:
+    """The process-wide manifest, built on first use."""
+    global _manifest, _by_hashed
+    if _manifest is None:
+        with _lock:
+            if _manifest is None:
+                built = build_manifest()
+                _by_hashed = {a.hashed: a for a in built.values()}
+                _manifest = built
+    return _manifest
+
+
+def lookup(url_path: str) -> tuple[Optional[Asset], bool]:
+    """Asset for a path under /assets/, and whether it was the hashed URL."""
+    assets = manifest()
+    asset = _by_hashed.get(url_path)
+    if asset is not None:
+        return asset, True
+    return assets.get(url_path), False
+
+
+def asset_url(logical: str) -> str:
+    """Hashed URL for an asset; the plain URL if it is not in the manifest."""
+    asset = manifest().get(logical.lstrip("/"))
+    return f"/assets/{asset.hashed if asset else logical.lstrip('/')}"
+
+
+def rewrite_asset_urls(html: str) -> str:
+    """Point ``assets/...`` references in a document at their hashed URLs."""
+    assets = manifest()
+
+    def repl(m: re.Match) -> str:
+        asset = assets.get(m.group("path"))
+        if asset is None:
+            return m.group(0)
+        return f"{m.group('prefix')}/assets/{asset.hashed}"
+
+    return _ASSET_REF.sub(repl, html)
+
+
+if __name__ == "__main__":
+    # Prebuild compressed siblings, e.g. during the Docker image build
+    for asset in build_manifest().values():
+        variants = [v.suffix for v in (asset.gzip, asset.br) if v]
+        print(f"{asset.logical} -> {asset.hashed} {' '.join(variants)}")
@@ -0,0 +1,152 @@
+"""Pre-built HTTP bodies: strong ETags, 304s and precompressed variants.
+
+A ``CachedBody`` is built once (identity, gzip and, if the optional
+``brotli`` package is installed, br) and then served per request with
+only header work: ``If-None-Match`` gets a 304, otherwise the best
+encoding the client accepts is picked.
+"""
+from __future__ import annotations
+import gzip
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+from fastapi import Request
+from fastapi.responses import Response
+from core.runtime import run_blocking
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+@dataclass(frozen=True, slots=True)
+class CachedBody:
+    body: bytes
+    media_type: str
+    etag: str  # quoted, strong
+    gzip: Optional[bytes] = None
+    br: Optional[bytes] = None
+
+
+def build_body(body: bytes, media_type: str) -> CachedBody:
+    """Hash and precompress ``body``; compressed variants are kept only if smaller."""
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    gz = br = None
+    if len(body) >= MIN_COMPRESS_SIZE:
+        gz = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gz) >= len(body):
+            gz = None
+        if BROTLI_AVAILABLE:
+            br = brotli.compress(body, quality=11)
+            if len(br) >= len(body):
+                br = None
+    return CachedBody(body, media_type, etag, gz, br)
+
+
+def _accepted(accept_encoding: str) -> dict[str, float]:
+    prefs = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            prefs[coding] = q
+    return prefs
+
+
+def choose_encoding(accept_encoding: str, available) -> Optional[str]:
+    """Best of the ``available`` encodings ("br", "gzip") the client accepts, or None."""
+    prefs = _accepted(accept_encoding or "")
+    best, best_q = None, 0.0
+    for coding in ("br", "gzip"):
+        if coding not in available:
+            continue
+        q = prefs.get(coding, prefs.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    base = etag.strip('"')
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        # Variant tags ("<hash>-br") identify the same content
+        if tag.strip('"').split("-", 1)[0] == base:
+            return True
+    return False
+
+
+def cached_response(request: Request, cached: CachedBody, cache_control: str = "no-cache",
+                    status_code: int = 200) -> Response:
+    """Serve ``cached``: 304 on a matching ``If-None-Match``, else the best encoding."""
+    available = [c for c in ("br", "gzip") if getattr(cached, c) is not None]
+    coding = choose_encoding(request.headers.get("accept-encoding", ""), available)
+    etag = cached.etag if coding is None else f'"{cached.etag.strip(chr(34))}-{coding}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    body = cached.body if coding is None else getattr(cached, coding)
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    return Response(content=body, status_code=status_code, media_type=cached.media_type, headers=headers)
+
+
+class PrecomputedPage:
+    """A file rendered once through ``transform`` and rebuilt when it changes.
+
+    The file is stat'ed at most every ``check_interval`` seconds, so
+    requests in between touch neither the disk nor the transform.
+    """
+
+    def __init__(self, path: Path, transform: Optional[Callable[[str], str]] = None,
+                 media_type: str = "text/html; charset=utf-8", check_interval: float = 2.0):
+        self.path = path
+        self.transform = transform
+        self.media_type = media_type
+        self.check_interval = check_interval
+        self._key = None
+        self._body: Optional[CachedBody] = None
+        self._checked = float("-inf")
+
+    def load(self) -> Optional[CachedBody]:
+        """Rebuild if the file changed; None if it does not exist."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._key, self._body = None, None
+        else:
+            key = (st.st_mtime_ns, st.st_size)
+            if key != self._key:
+                text = self.path.read_text(encoding="utf-8")
+                if self.transform is not None:
+                    text = self.transform(text)
+                self._body = build_body(text.encode("utf-8"), self.media_type)
+                self._key = key
+        self._checked = time.monotonic()
+        return self._body
+
+    async def get(self) -> Optional[CachedBody]:
+        if time.monotonic() - self._checked < self.check_interval:
+            return self._body
+        return await run_blocking(self.load)
@@ -1,24 +1,832 @@
+"""Booking storage.
+
+SQLite (WAL mode) is the system of record; ``bookings.xlsx`` is only an
+export for ops staff. The table schema is derived from ``COLUMNS``. Row
+changes are recorded in ``booking_events`` (in the same transaction, for
+``booking_history``) and appended to the audit log (``utils.journal``).
+"""
 from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
 from pathlib import Path
+from typing import Iterator, Mapping, Optional
 import pandas as pd
-from core.config import DATA_DIR, BOOKINGS_FILE
+from openpyxl import Workbook
+from core.config import DATA_DIR, BOOKINGS_FILE, BOOKINGS_DB, BOOKINGS_JOURNAL, BOOKING_PARTITIONS_CACHED
+from utils.journal import append_event, iter_events
+from utils.locks import LockUnavailable, file_lock
+from utils.models import PAYMENT_STATUSES, Booking, BookingStatus
 
 COLUMNS = [
     "booking_id","created_at","name","phone","tickets","ticket_price","total_amount","status",
     "payment_intent_id","payment_status","redirect_url","notes"
 ]
 
-def ensure_data_file():
+# Per-row optimistic concurrency counter, bumped on every update. It is
+# returned alongside COLUMNS but is not part of the Excel export.
+VERSION_COLUMN = "version"
+_SELECT = f"SELECT {', '.join(COLUMNS + [VERSION_COLUMN])} FROM bookings"
+
+# SQL form of normalize_intent_id() for stored ids; backs an expression index
+_INTENT_KEY_SQL = "lower(trim(payment_intent_id, '{}\"'' '))"
+
+# Column affinities; anything not listed is TEXT.
+_SQL_TYPES = {"tickets": "INTEGER", "ticket_price": "REAL", "total_amount": "REAL"}
+
+_local = threading.local()
+
+
+
+class BookingConflictError(Exception):
+    """A booking changed in the store after the caller read it."""
+
+    def __init__(self, booking_ids):
+        self.booking_ids = list(booking_ids)
+        super().__init__(f"Bookings modified concurrently: {', '.join(self.booking_ids)}")
+
+
+_cache_lock = threading.Lock()
+_cache: dict = {"key": None, "df": None}
+_cache_stats = {"hits": 0, "misses": 0}
+
+# How many change-log entries to retain for index catch-up
+_CHANGE_LOG_KEEP = 10000
+
+
+def _schema_sql() -> list[str]:
+    cols = ",\n    ".join(
+        f"{c} {_SQL_TYPES.get(c, 'TEXT')}" + (" PRIMARY KEY" if c == "booking_id" else "")
+        for c in COLUMNS
+    )
+    # store_meta.generation is bumped by every write from any process; it
+    # keys the in-process load_bookings() cache.
+    bump = "UPDATE store_meta SET generation = generation + 1"
+    return [
+        f"CREATE TABLE IF NOT EXISTS bookings (\n    {cols},\n    {VERSION_COLUMN} INTEGER NOT NULL DEFAULT 1\n)",
+        "CREATE INDEX IF NOT EXISTS ix_bookings_payment_intent_id ON bookings(payment_intent_id)",
+        f"CREATE INDEX IF NOT EXISTS ix_bookings_intent_key ON bookings({_INTENT_KEY_SQL})",
+        "CREATE INDEX IF NOT EXISTS ix_bookings_created_at ON bookings(created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_bookings_pending ON bookings(created_at) WHERE status = 'pending'",
+        "CREATE TABLE IF NOT EXISTS booking_sequences (day TEXT PRIMARY KEY, seq INTEGER NOT NULL)",
+        # snapshot_generation: generation last written to bookings.xlsx
+        "CREATE TABLE IF NOT EXISTS store_meta (id INTEGER PRIMARY KEY CHECK (id = 1), generation INTEGER NOT NULL, "
+        "snapshot_generation INTEGER NOT NULL DEFAULT -1)",
+        "INSERT OR IGNORE INTO store_meta (id, generation) VALUES (1, 0)",
+        f"CREATE TRIGGER IF NOT EXISTS tr_bookings_ins AFTER INSERT ON bookings BEGIN {bump}; END",
+        f"CREATE TRIGGER IF NOT EXISTS tr_bookings_upd AFTER UPDATE ON bookings BEGIN {bump}; END",
+        f"CREATE TRIGGER IF NOT EXISTS tr_bookings_del AFTER DELETE ON bookings BEGIN {bump}; END",
+        # Change log of touched booking ids; lets the in-memory indexes catch
+        # up on other processes' writes without a full reload.
+        "CREATE TABLE IF NOT EXISTS store_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, booking_id TEXT NOT NULL)",
+        "CREATE TRIGGER IF NOT EXISTS tr_changes_ins AFTER INSERT ON bookings BEGIN "
+        "INSERT INTO store_changes (booking_id) VALUES (NEW.booking_id); END",
+        "CREATE TRIGGER IF NOT EXISTS tr_changes_upd AFTER UPDATE ON bookings BEGIN "
+        "INSERT INTO store_changes (booking_id) VALUES (NEW.booking_id); END",
+        "CREATE TRIGGER IF NOT EXISTS tr_changes_del AFTER DELETE ON bookings BEGIN "
+        "INSERT INTO store_changes (booking_id) VALUES (OLD.booking_id); END",
+        f"CREATE TRIGGER IF NOT EXISTS tr_changes_prune AFTER INSERT ON store_changes BEGIN "
+        f"DELETE FROM store_changes WHERE seq <= NEW.seq - {_CHANGE_LOG_KEEP}; END",
+        # Outcomes of POST /book by idempotency key; response is NULL while
+        # the first request is still in flight.
+        "CREATE TABLE IF NOT EXISTS idempotency_keys (key TEXT PRIMARY KEY, response TEXT, expires_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_idempotency_expires ON idempotency_keys(expires_at)",
+        # Per-booking change history; the journal file is rotated, this is not
+        "CREATE TABLE IF NOT EXISTS booking_events (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "booking_id TEXT NOT NULL, ts TEXT NOT NULL, event TEXT NOT NULL, fields TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_booking_events_booking ON booking_events(booking_id, seq)",
+        # Gate admissions per booking, kept apart from bookings so check-in
+        # writes stay small and never bump the bookings generation.
+        "CREATE TABLE IF NOT EXISTS checkins (booking_id TEXT PRIMARY KEY, tickets INTEGER NOT NULL, "
+        "admitted INTEGER NOT NULL CHECK (admitted <= tickets), first_at TEXT NOT NULL, last_at TEXT NOT NULL)",
+    ]
+
+
+def _clean(value):
+    """Map pandas missing values (NaN/NaT) to NULL."""
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _connect() -> sqlite3.Connection:
+    """Return this thread's connection, opening it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == BOOKINGS_DB:
+        return conn
     DATA_DIR.mkdir(exist_ok=True)
+    conn = sqlite3.connect(str(BOOKINGS_DB), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for stmt in _schema_sql():
+        conn.execute(stmt)
+    _migrate(conn)
+    _import_legacy_xlsx(conn)
+    _local.conn, _local.path = conn, BOOKINGS_DB
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Bring databases created by older versions up to the current schema."""
+    existing = {r[1] for r in conn.execute("PRAGMA table_info(bookings)")}
+    if VERSION_COLUMN not in existing:
+        try:
+            conn.execute(f"ALTER TABLE bookings ADD COLUMN {VERSION_COLUMN} INTEGER NOT NULL DEFAULT 1")
+        except sqlite3.OperationalError:
+            pass  # added concurrently by another worker
+    meta = {r[1] for r in conn.execute("PRAGMA table_info(store_meta)")}
+    if "snapshot_generation" not in meta:
+        try:
+            conn.execute("ALTER TABLE store_meta ADD COLUMN snapshot_generation INTEGER NOT NULL DEFAULT -1")
+        except sqlite3.OperationalError:
+            pass
+    if not conn.execute("SELECT 1 FROM booking_events LIMIT 1").fetchone() and BOOKINGS_JOURNAL.exists():
+        _import_journal(conn)
+
+
+def _import_journal(conn: sqlite3.Connection) -> None:
+    """One-time copy of the journal written before booking_events existed."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not conn.execute("SELECT 1 FROM booking_events LIMIT 1").fetchone():
+            conn.executemany(
+                "INSERT INTO booking_events (booking_id, ts, event, fields) VALUES (?, ?, ?, ?)",
+                ((str(e.get("booking_id")), e.get("ts") or "", e.get("event") or "",
+                  json.dumps(e.get("fields") or {}, ensure_ascii=False, default=str))
+                 for e in iter_events() if e.get("booking_id")),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _import_legacy_xlsx(conn: sqlite3.Connection) -> None:
+    """One-time import of an existing bookings.xlsx into an empty store."""
     if not BOOKINGS_FILE.exists():
-        df = pd.DataFrame(columns=COLUMNS)
-        df.to_excel(BOOKINGS_FILE, index=False)
+        return
+    if conn.execute("SELECT 1 FROM bookings LIMIT 1").fetchone():
+        return
+    df = pd.read_excel(BOOKINGS_FILE)
+    if df.empty:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another worker may have imported while we waited for the lock.
+        if not conn.execute("SELECT 1 FROM bookings LIMIT 1").fetchone():
+            _upsert_rows(conn, df)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _row_values(row: dict) -> list:
+    return [_clean(row.get(c)) for c in COLUMNS]
+
+
+def _upsert_rows(conn: sqlite3.Connection, df: pd.DataFrame) -> list[tuple[str, str, dict]]:
+    """Insert new rows and update only rows whose values actually changed.
+
+    If ``df`` carries the version column, a changed row whose stored version
+    differs from the one in ``df`` was modified by someone else since it was
+    read; nothing is written and BookingConflictError is raised.
+
+    Returns the applied changes as (event, booking_id, fields) tuples.
+    """
+    frame = df.reindex(columns=COLUMNS + [VERSION_COLUMN])
+    frame = frame[frame["booking_id"].notna()]
+    current = {r["booking_id"]: dict(r) for r in conn.execute(_SELECT)}
+    changes, conflicts = [], []
+    for row in frame.to_dict("records"):
+        values = dict(zip(COLUMNS, _row_values(row)))
+        values["booking_id"] = booking_id = str(values["booking_id"])
+        old = current.get(booking_id)
+        if old is None:
+            changes.append(("create", booking_id, values))
+            continue
+        changed = {c: v for c, v in values.items() if v != old[c]}
+        if not changed:
+            continue
+        seen = _clean(row.get(VERSION_COLUMN))
+        if seen is not None and int(seen) != old[VERSION_COLUMN]:
+            conflicts.append(booking_id)
+        changes.append(("update", booking_id, changed))
+    if conflicts:
+        raise BookingConflictError(conflicts)
+    for event, booking_id, fields in changes:
+        if event == "create":
+            _insert(conn, fields)
+        else:
+            _update(conn, booking_id, fields)
+    return changes
+
+
+def _record_events(conn: sqlite3.Connection, changes: list[tuple[str, str, dict]]) -> None:
+    """Add (event, booking_id, fields) changes to booking_events; call inside the write's transaction."""
+    ts = time.strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany(
+        "INSERT INTO booking_events (booking_id, ts, event, fields) VALUES (?, ?, ?, ?)",
+        [(str(b), ts, e, json.dumps(f, ensure_ascii=False, default=str)) for e, b, f in changes],
+    )
+
+
+def _insert(conn: sqlite3.Connection, values: dict) -> None:
+    conn.execute(
+        f"INSERT INTO bookings ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+        _row_values(values),
+    )
+
+
+def _update(conn: sqlite3.Connection, booking_id: str, fields: dict,
+            expected_version: Optional[int] = None) -> int:
+    """Apply ``fields`` to one row unless they are already current."""
+    sets = ", ".join(f"{k} = ?" for k in fields)
+    changed = " OR ".join(f"{k} IS NOT ?" for k in fields)
+    values = [_clean(v) for v in fields.values()]
+    where = f"booking_id = ? AND ({changed})"
+    params = values + [str(booking_id)] + values
+    if expected_version is not None:
+        where += f" AND {VERSION_COLUMN} = ?"
+        params.append(int(expected_version))
+    cur = conn.execute(
+        f"UPDATE bookings SET {sets}, {VERSION_COLUMN} = {VERSION_COLUMN} + 1 WHERE {where}",
+        params,
+    )
+    return cur.rowcount
+
+
+def ensure_data_file():
+    _connect()
+
+
+def _file_identity() -> tuple:
+    st = os.stat(BOOKINGS_DB)
+    return (st.st_dev, st.st_ino)
+
+
+def _generation(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT generation FROM store_meta WHERE id = 1").fetchone()[0]
+
+
+def _invalidate_cache() -> None:
+    with _cache_lock:
+        _cache["key"] = _cache["df"] = None
+
+
+def normalize_intent_id(pi_id) -> str:
+    """Canonical form of a payment intent id as it may come back from Ziina
+    redirects: URL-encoded, wrapped in braces or quotes, or differently cased."""
+    if pi_id is None:
+        return ""
+    value = urllib.parse.unquote(str(pi_id)).strip().strip('{}"\' ').strip()
+    return value.lower()
+
+
+def partition_key(booking_id) -> Optional[str]:
+    """Month partition (``YYYYMM``) of a ``SL-YYYYMMDD-NNN`` booking id."""
+    booking_id = str(booking_id)
+    if len(booking_id) >= 11 and booking_id.startswith("SL-") and booking_id[3:11].isdigit():
+        return booking_id[3:9]
+    return None
+
+
+def _partition_bounds(key: str) -> tuple[str, str]:
+    return f"SL-{key}", f"SL-{key}\uffff"
+
+
+class _Partition:
+    __slots__ = ("rows", "by_intent")
+
+    def __init__(self):
+        self.rows: dict[str, Booking] = {}
+        self.by_intent: dict[str, str] = {}
+
+    def put(self, row: Mapping) -> None:
+        booking = Booking.from_row(row)
+        self.drop(booking.booking_id)
+        self.rows[booking.booking_id] = booking
+        key = normalize_intent_id(booking.payment_intent_id)
+        if key:
+            self.by_intent[key] = booking.booking_id
+
+    def drop(self, booking_id: str) -> None:
+        old = self.rows.pop(booking_id, None)
+        if old is not None:
+            key = normalize_intent_id(old.payment_intent_id)
+            if self.by_intent.get(key) == booking_id:
+                del self.by_intent[key]
+
+
+class _BookingIndex:
+    """In-memory booking_id -> row and intent key -> booking_id maps,
+    partitioned by booking month.
+
+    Partitions are loaded lazily when a lookup routes to them (by the
+    ``SL-YYYYMMDD-`` prefix) and only the most recently used
+    ``BOOKING_PARTITIONS_CACHED`` are kept, so memory tracks the hot
+    working set rather than the whole season. Loaded partitions are kept
+    current by replaying ``store_changes`` (written by triggers for every
+    writer), so a lookup costs one change-log probe plus dict access.
+    """
+
+    def __init__(self, max_partitions: int):
+        self.lock = threading.Lock()
+        self.max_partitions = max(1, max_partitions)
+        self.identity = None
+        self.seq = None
+        self.partitions: OrderedDict[str, _Partition] = OrderedDict()
+
+    def sync(self, conn: sqlite3.Connection) -> None:
+        """Apply writes made since the last sync to the loaded partitions."""
+        identity = _file_identity()
+        seq = conn.execute("SELECT MAX(seq) FROM store_changes").fetchone()[0] or 0
+        if identity == self.identity and seq == self.seq:
+            return
+        conn.execute("BEGIN")
+        try:
+            seq = conn.execute("SELECT MAX(seq) FROM store_changes").fetchone()[0] or 0
+            oldest = conn.execute("SELECT MIN(seq) FROM store_changes").fetchone()[0] or 0
+            if identity != self.identity or self.seq is None or oldest > self.seq + 1:
+                self.partitions.clear()
+            elif self.partitions:
+                touched = [r[0] for r in conn.execute(
+                    "SELECT DISTINCT booking_id FROM store_changes WHERE seq > ?", (self.seq,)
+                )]
+                touched = [b for b in touched if partition_key(b) in self.partitions]
+                for booking_id in touched:
+                    self.partitions[partition_key(booking_id)].drop(booking_id)
+                for start in range(0, len(touched), 500):
+                    chunk = touched[start:start + 500]
+                    marks = ", ".join("?" for _ in chunk)
+                    for row in conn.execute(f"{_SELECT} WHERE booking_id IN ({marks})", chunk):
+                        self.partitions[partition_key(row["booking_id"])].put(dict(row))
+        finally:
+            conn.execute("COMMIT")
+        self.identity, self.seq = identity, seq
+
+    def partition(self, conn: sqlite3.Connection, key: str) -> _Partition:
+        part = self.partitions.get(key)
+        if part is not None:
+            self.partitions.move_to_end(key)
+            return part
+        part = _Partition()
+        for row in conn.execute(f"{_SELECT} WHERE booking_id >= ? AND booking_id < ?", _partition_bounds(key)):
+            part.put(dict(row))
+        self.partitions[key] = part
+        while len(self.partitions) > self.max_partitions:
+            self.partitions.popitem(last=False)
+        return part
+
+    def get(self, conn: sqlite3.Connection, booking_id: str) -> Optional[Booking]:
+        booking_id = str(booking_id)
+        key = partition_key(booking_id)
+        with self.lock:
+            self.sync(conn)
+            if key is None:
+                row = conn.execute(f"{_SELECT} WHERE booking_id = ?", (booking_id,)).fetchone()
+                return Booking.from_row(dict(row)) if row else None
+            return self.partition(conn, key).rows.get(booking_id)
+
+    def get_by_intent(self, conn: sqlite3.Connection, pi_id: str) -> Optional[Booking]:
+        intent_key = normalize_intent_id(pi_id)
+        with self.lock:
+            self.sync(conn)
+            for part in reversed(self.partitions.values()):
+                booking_id = part.by_intent.get(intent_key)
+                if booking_id:
+                    return part.rows[booking_id]
+            row = conn.execute(
+                f"SELECT booking_id FROM bookings WHERE {_INTENT_KEY_SQL} = ? LIMIT 1", (intent_key,)
+            ).fetchone()
+        return self.get(conn, row[0]) if row else None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "partitions": list(self.partitions),
+                "rows": sum(len(p.rows) for p in self.partitions.values()),
+            }
+
+
+_index = _BookingIndex(BOOKING_PARTITIONS_CACHED)
+
+
+def _typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Apply explicit dtypes: categoricals for the status columns, compact
+    numerics, object for free text."""
+    status_values = [s.value for s in BookingStatus]
+    status_values += sorted(set(df["status"].dropna()) - set(status_values))
+    payment_values = list(PAYMENT_STATUSES)
+    payment_values += sorted(set(df["payment_status"].dropna()) - set(payment_values))
+    return df.astype({
+        "tickets": "Int32",
+        "ticket_price": "float64",
+        "total_amount": "float64",
+        "status": pd.CategoricalDtype(status_values),
+        "payment_status": pd.CategoricalDtype(payment_values),
+        VERSION_COLUMN: "int32",
+    })
 
 
 def load_bookings() -> pd.DataFrame:
-    ensure_data_file()
-    return pd.read_excel(BOOKINGS_FILE)
+    """Return all bookings, re-reading the store only when it has changed.
+
+    The cached frame is keyed on the database file identity plus the write
+    generation, so writes from other workers or the Streamlit app are seen
+    on the next call. Callers get a copy and may mutate it freely.
+    """
+    conn = _connect()
+    key = (_file_identity(), _generation(conn))
+    with _cache_lock:
+        if _cache["key"] == key:
+            _cache_stats["hits"] += 1
+            return _cache["df"].copy()
+    conn.execute("BEGIN")
+    try:
+        key = (_file_identity(), _generation(conn))
+        df = _typed_frame(pd.read_sql_query(f"{_SELECT} ORDER BY rowid", conn))
+    finally:
+        conn.execute("COMMIT")
+    with _cache_lock:
+        _cache_stats["misses"] += 1
+        _cache["key"], _cache["df"] = key, df
+    return df.copy()
+
+
+def cache_stats() -> dict:
+    with _cache_lock:
+        return {**_cache_stats, "cached_rows": 0 if _cache["df"] is None else len(_cache["df"])}
 
 
 def save_bookings(df: pd.DataFrame) -> None:
-    df.to_excel(BOOKINGS_FILE, index=False)
+    """Bulk upsert of a whole frame (kept for callers that edit DataFrames)."""
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        changes = _upsert_rows(conn, df)
+        _record_events(conn, changes)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if changes:
+        _invalidate_cache()
+    for event, booking_id, fields in changes:
+        append_event(event, booking_id, fields)
+
+
+def insert_booking(row: Booking | dict, idempotency: Optional[tuple[str, dict, float]] = None) -> None:
+    """Insert one booking. With ``idempotency=(key, response, ttl)`` the
+    claimed key is completed in the same transaction and kept for ``ttl``
+    seconds, so a stored booking always has its replayable response."""
+    if isinstance(row, Booking):
+        row = row.to_row()
+    values = dict(zip(COLUMNS, _row_values(row)))
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _insert(conn, values)
+        _record_events(conn, [("create", values["booking_id"], values)])
+        if idempotency is not None:
+            _complete_idempotency_key(conn, *idempotency)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _invalidate_cache()
+    append_event("create", values["booking_id"], values)
+
+
+def update_booking(booking_id: str, expected_version: Optional[int] = None, **fields) -> bool:
+    """Update the given columns of one booking. Returns False if it does not exist.
+
+    With ``expected_version`` the update only applies if the row is still at
+    that version; otherwise BookingConflictError is raised.
+    """
+    fields = {k: _clean(v) for k, v in fields.items() if k in COLUMNS and k != "booking_id"}
+    if not fields:
+        return get_booking(booking_id) is not None
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        applied = _update(conn, booking_id, fields, expected_version)
+        if applied:
+            _record_events(conn, [("update", booking_id, fields)])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if applied:
+        _invalidate_cache()
+        append_event("update", booking_id, fields)
+        return True
+    current = get_booking(booking_id)
+    if current is None:
+        return False
+    if expected_version is not None and current.version != int(expected_version):
+        raise BookingConflictError([str(booking_id)])
+    return True
+
+
+def update_bookings(updates: list[tuple[str, dict, Optional[int]]]) -> int:
+    """Apply many single-row updates in one transaction. Returns rows changed.
+
+    Each update is ``(booking_id, fields, expected_version)``; a row no longer
+    at its expected version was changed since the update was planned and is
+    skipped, so the caller re-plans it from the current row next time.
+    """
+    applied = []
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for booking_id, fields, expected_version in updates:
+            fields = {k: _clean(v) for k, v in fields.items() if k in COLUMNS and k != "booking_id"}
+            if fields and _update(conn, booking_id, fields, expected_version):
+                applied.append((booking_id, fields))
+        _record_events(conn, [("update", b, f) for b, f in applied])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if applied:
+        _invalidate_cache()
+    for booking_id, fields in applied:
+        append_event("update", booking_id, fields)
+    return len(applied)
+
+
+def pending_intents(since: Optional[str] = None) -> list[Booking]:
+    """Pending bookings that have a payment intent to check, oldest first.
+
+    ``since`` (a ``created_at`` string) skips bookings created before it.
+    """
+    rows = _connect().execute(
+        f"{_SELECT} WHERE status = 'pending' AND COALESCE(payment_intent_id, '') != '' "
+        "AND created_at >= ? ORDER BY created_at",
+        (since or "",),
+    ).fetchall()
+    return [Booking.from_row(dict(r)) for r in rows]
+
+
+def get_booking(booking_id: str) -> Optional[Booking]:
+    return _index.get(_connect(), booking_id)
+
+
+def find_booking_by_intent(pi_id: str) -> Optional[Booking]:
+    """Look up a booking by payment intent id, matching on the normalized key."""
+    if not normalize_intent_id(pi_id):
+        return None
+    return _index.get_by_intent(_connect(), pi_id)
+
+
+def booking_summary() -> dict:
+    """Dashboard KPIs computed in SQL, without loading the table."""
+    row = _connect().execute(
+        "SELECT COUNT(*), COALESCE(SUM(tickets), 0), COALESCE(SUM(total_amount), 0), "
+        "COALESCE(SUM(CASE WHEN status = 'paid' THEN total_amount END), 0), "
+        "COALESCE(SUM(CASE WHEN status = 'pending' THEN total_amount END), 0) FROM bookings"
+    ).fetchone()
+    return {
+        "total_bookings": row[0],
+        "total_tickets": int(row[1]),
+        "total_amount": float(row[2]),
+        "total_paid": float(row[3]),
+        "total_pending": float(row[4]),
+    }
+
+
+def recent_bookings(limit: int = 25) -> list[dict]:
+    rows = _connect().execute(
+        f"{_SELECT} ORDER BY created_at DESC LIMIT ?", (int(limit),)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def store_generation() -> int:
+    """Write generation of the store; changes whenever any booking changes."""
+    return _generation(_connect())
+
+
+def snapshot_generation() -> int:
+    """Generation the bookings.xlsx snapshot was last written at (-1: never)."""
+    return _connect().execute("SELECT snapshot_generation FROM store_meta WHERE id = 1").fetchone()[0]
+
+
+def mark_snapshot(generation: int) -> None:
+    _connect().execute("UPDATE store_meta SET snapshot_generation = ? WHERE id = 1", (int(generation),))
+
+
+def booking_history(booking_id: str) -> list[dict]:
+    """All recorded changes of one booking, oldest first."""
+    rows = _connect().execute(
+        "SELECT ts, event, booking_id, fields FROM booking_events WHERE booking_id = ? ORDER BY seq",
+        (str(booking_id),),
+    ).fetchall()
+    return [{"ts": r[0], "event": r[1], "booking_id": r[2], "fields": json.loads(r[3])} for r in rows]
+
+
+def iter_bookings(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                  status: Optional[str] = None, batch_size: int = 500) -> Iterator[dict]:
+    """Stream bookings (oldest first) matching the filters, one dict per row.
+
+    ``date_from``/``date_to`` are inclusive ``YYYY-MM-DD`` bounds on
+    ``created_at``. Uses its own connection and read snapshot, so the
+    generator may be advanced from any thread.
+    """
+    clauses, params = [], []
+    if date_from:
+        clauses.append("created_at >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append("created_at < ?")
+        params.append(str(date_to) + "\uffff")
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    _connect()  # schema / migrations
+    conn = sqlite3.connect(str(BOOKINGS_DB), timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("BEGIN")
+        cur = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM bookings{where} ORDER BY created_at", params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    finally:
+        conn.close()
+
+
+def index_stats() -> dict:
+    return _index.stats()
+
+
+def next_booking_seq(prefix: str) -> int:
+    """Atomically reserve the next sequence number for booking ids under ``prefix``.
+
+    The counter lives in ``booking_sequences`` and is incremented inside a
+    write transaction, so it is unique across threads, workers and restarts.
+    The first allocation for a prefix seeds itself from ids already stored.
+    """
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "UPDATE booking_sequences SET seq = seq + 1 WHERE day = ? RETURNING seq", (prefix,)
+        ).fetchone()
+        if row is None:
+            existing = conn.execute(
+                "SELECT MAX(CAST(substr(booking_id, ?) AS INTEGER)) FROM bookings "
+                "WHERE booking_id >= ? AND booking_id < ?",
+                (len(prefix) + 1, prefix, prefix + "\uffff"),
+            ).fetchone()[0]
+            row = conn.execute(
+                "INSERT INTO booking_sequences (day, seq) VALUES (?, ?) RETURNING seq",
+                (prefix, (existing or 0) + 1),
+            ).fetchone()
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row[0]
+
+
+def claim_idempotency_key(key: str, lease: float) -> Optional[dict]:
+    """Claim ``key`` for a new request, or return the existing claim.
+
+    Returns None if the caller now owns the key and should do the work, else
+    ``{"done": bool, "response": dict | None}`` for the earlier request.
+    An unfinished claim only lasts ``lease`` seconds, so one left behind by
+    a killed worker is taken over once it runs out. Expired keys are purged
+    on the way.
+    """
+    now = time.time()
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,))
+        claimed = conn.execute(
+            "INSERT OR IGNORE INTO idempotency_keys (key, response, expires_at) VALUES (?, NULL, ?)",
+            (key, now + lease),
+        ).rowcount
+        row = None if claimed else conn.execute(
+            "SELECT response FROM idempotency_keys WHERE key = ?", (key,)
+        ).fetchone()
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    return {"done": row[0] is not None, "response": json.loads(row[0]) if row[0] else None}
+
+
+def idempotent_response(key: str) -> Optional[dict]:
+    """The stored response for ``key``, if its request has finished."""
+    row = _connect().execute(
+        "SELECT response FROM idempotency_keys WHERE key = ? AND expires_at >= ?", (key, time.time())
+    ).fetchone()
+    return json.loads(row[0]) if row and row[0] else None
+
+
+def _complete_idempotency_key(conn: sqlite3.Connection, key: str, response: dict, ttl: float) -> None:
+    conn.execute(
+        "UPDATE idempotency_keys SET response = ?, expires_at = ? WHERE key = ?",
+        (json.dumps(response), time.time() + ttl, key),
+    )
+
+
+def release_idempotency_key(key: str) -> None:
+    """Forget an unfinished claim so a retry can run the request again.
+
+    A claim completed by ``insert_booking`` is kept: its booking exists.
+    """
+    _connect().execute("DELETE FROM idempotency_keys WHERE key = ? AND response IS NULL", (key,))
+
+
+def admit_guests(booking_id: str, tickets: int, count: Optional[int] = None) -> dict:
+    """Atomically admit ``count`` guests (default: all remaining) of a booking
+    with ``tickets`` places.
+
+    Nothing is recorded unless all ``count`` fit; ``admitted_now`` is 0 then.
+    Returns ``{"admitted_now", "admitted", "tickets", "remaining"}``.
+    """
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT admitted, tickets FROM checkins WHERE booking_id = ?", (booking_id,)
+        ).fetchone()
+        admitted, allowed = (row[0], min(row[1], tickets)) if row else (0, tickets)
+        admit = allowed - admitted if count is None else count
+        if not 0 < admit <= allowed - admitted:
+            admit = 0
+        else:
+            admitted += admit
+            conn.execute(
+                "INSERT INTO checkins (booking_id, tickets, admitted, first_at, last_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(booking_id) DO UPDATE SET tickets = excluded.tickets, "
+                "admitted = excluded.admitted, last_at = excluded.last_at",
+                (booking_id, allowed, admitted, now, now),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return {"admitted_now": admit, "admitted": admitted, "tickets": allowed, "remaining": allowed - admitted}
+
+
+def checkin_totals(day: Optional[str] = None) -> dict:
+    """Bookings and guests admitted, overall or for bookings first scanned on ``day``."""
+    where, params = ("WHERE first_at >= ? AND first_at < ?", (day, day + "\uffff")) if day else ("", ())
+    row = _connect().execute(
+        f"SELECT COUNT(*), COALESCE(SUM(admitted), 0) FROM checkins {where}", params
+    ).fetchone()
+    return {"bookings": row[0], "guests": row[1]}
+
+
+def write_bookings_xlsx(path: Path, rows: Iterator[dict]) -> None:
+    """Stream ``rows`` into a workbook with openpyxl's write-only mode."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("bookings")
+    ws.append(COLUMNS)
+    for row in rows:
+        ws.append([row.get(c) for c in COLUMNS])
+    wb.save(path)
+
+
+def export_bookings_xlsx(path: Path = BOOKINGS_FILE, blocking: bool = True) -> Optional[Path]:
+    """Write the current bookings to an Excel workbook for ops staff.
+
+    The workbook is written to a temp file and renamed into place under a
+    cross-process lock, so readers never see a half-written file and
+    concurrent workers do not export over each other. With
+    ``blocking=False`` returns None if another process is exporting.
+    """
+    tmp = path.with_name(f".{path.stem}.{os.getpid()}{path.suffix}")
+    try:
+        with file_lock(path.with_name(f".{path.name}.lock"), blocking=blocking):
+            write_bookings_xlsx(tmp, iter_bookings())
+            os.replace(tmp, path)
+    except LockUnavailable:
+        return None
+    finally:
+        tmp.unlink(missing_ok=True)
+    return path
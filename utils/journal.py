@@ -0,0 +1,108 @@
+"""Booking audit log and the background bookings.xlsx snapshot.
+
+Every create / update applied through ``utils.io`` is appended as one JSON
+line to ``bookings_journal.jsonl``. The app does not read it back (history
+is served from the store's ``booking_events`` table); it is an audit trail
+kept outside the database for ops staff, e.g. to trace a booking after
+restoring ``bookings.db`` from a backup. It is rotated once it passes
+``BOOKINGS_JOURNAL_MAX_BYTES`` (``.1`` is the newest old segment).
+
+The snapshot exporter writes a fresh Excel file off the request path
+whenever the store generation moved past the one recorded in
+``store_meta``. Only the background-job leader runs it, so one worker does
+the export.
+"""
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Iterator
+from core.config import BOOKINGS_JOURNAL, BOOKINGS_JOURNAL_KEEP, BOOKINGS_JOURNAL_MAX_BYTES, DATA_DIR
+
+_append_lock = threading.Lock()
+
+
+def append_event(event: str, booking_id: str, fields: dict) -> None:
+    """Append one event. Never raises: the journal must not fail a booking."""
+    record = {
+        "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "event": event,
+        "booking_id": str(booking_id),
+        "fields": fields,
+    }
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    try:
+        DATA_DIR.mkdir(exist_ok=True)
+        with _append_lock, open(BOOKINGS_JOURNAL, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        logging.error(f"Booking journal append failed: {e}")
+
+
+def iter_events() -> Iterator[dict]:
+    if not BOOKINGS_JOURNAL.exists():
+        return
+    with open(BOOKINGS_JOURNAL, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash
+
+
+def journal_size() -> int:
+    try:
+        return os.path.getsize(BOOKINGS_JOURNAL)
+    except OSError:
+        return 0
+
+
+def rotate_journal(max_bytes: int = BOOKINGS_JOURNAL_MAX_BYTES, keep: int = BOOKINGS_JOURNAL_KEEP) -> bool:
+    """Start a new journal file once the current one is ``max_bytes`` long,
+    keeping ``keep`` old segments."""
+    if journal_size() < max_bytes:
+        return False
+    with _append_lock:
+        segment = lambda n: BOOKINGS_JOURNAL.with_name(f"{BOOKINGS_JOURNAL.name}.{n}")
+        segment(keep).unlink(missing_ok=True)
+        for n in range(keep - 1, 0, -1):
+            if segment(n).exists():
+                os.replace(segment(n), segment(n + 1))
+        # Other workers reopen the file per append, so they follow the rename
+        os.replace(BOOKINGS_JOURNAL, segment(1))
+    return True
+
+
+def export_snapshot(force: bool = False) -> bool:
+    """Write a fresh bookings.xlsx if any booking changed since the last snapshot."""
+    from utils.io import export_bookings_xlsx, mark_snapshot, snapshot_generation, store_generation
+
+    generation = store_generation()
+    if not force and generation == snapshot_generation():
+        return False
+    if export_bookings_xlsx(blocking=False) is None:
+        return False  # an export is already being written
+    # The export read at least this generation; a later change re-exports
+    mark_snapshot(generation)
+    return True
+
+
+def run_snapshot_exporter(stop: threading.Event, interval: float, try_lead: Callable[[], bool]) -> None:
+    """Export the snapshot and rotate the audit log every ``interval``
+    seconds, and once more when ``stop`` is set, while ``try_lead()`` says
+    this process is the leader."""
+    while True:
+        stopped = stop.wait(interval)
+        try:
+            if try_lead():
+                export_snapshot()
+                rotate_journal()
+        except Exception as e:
+            logging.error(f"Booking snapshot export failed: {e}")
+        if stopped:
+            return
@@ -0,0 +1,92 @@
+"""Cross-process advisory file locks.
+
+Uses ``fcntl.flock`` on POSIX and ``msvcrt.locking`` on Windows; the lock is
+released automatically if the holding process dies.
+"""
+from __future__ import annotations
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockUnavailable(Exception):
+    """Raised by a non-blocking acquire when another process holds the lock."""
+
+
+def acquire(path: Path, blocking: bool = True) -> int:
+    """Open ``path`` and lock it, returning the file descriptor."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+            fcntl.flock(fd, flags)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        raise LockUnavailable(str(path))
+    return fd
+
+
+def release(fd: int) -> None:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def file_lock(path: Path, blocking: bool = True) -> Iterator[None]:
+    fd = acquire(path, blocking)
+    try:
+        yield
+    finally:
+        release(fd)
+
+
+class Leadership:
+    """Process-wide leadership held through a non-blocking lock on ``path``.
+
+    At most one process holds it; the OS frees it if the leader dies, and
+    ``try_lead`` lets followers take over. Safe to call from any thread.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None
+
+    def try_lead(self) -> bool:
+        """True if this process leads (now or already)."""
+        with self._lock:
+            if self._fd is None:
+                try:
+                    self._fd = acquire(self.path, blocking=False)
+                except LockUnavailable:
+                    return False
+                logging.info(f"This worker now leads background jobs ({self.path.name})")
+            return True
+
+    def resign(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                release(self._fd)
+                self._fd = None
@@ -2,44 +2,98 @@ from __future__ import annotations
 from datetime import datetime
 import pandas as pd
 from core.config import TICKET_PRICE_AED
-from utils.io import load_bookings, save_bookings
+from utils.io import BookingConflictError, find_booking_by_intent, insert_booking, next_booking_seq, update_booking
+from utils.models import Booking, BookingStatus
 
 
-def get_next_booking_id(df: pd.DataFrame) -> str:
+def get_next_booking_id(df: pd.DataFrame | None = None) -> str:
+    """Reserve and return the next ``SL-YYYYMMDD-NNN`` booking id.
+
+    ``df`` is accepted for backwards compatibility and ignored; ids come from
+    the store's per-day sequence. Past 999 the number simply grows to four
+    digits, which keeps the ``SL-<date>-<seq>`` shape.
+    """
     today = datetime.now().strftime("%Y%m%d")
     prefix = f"SL-{today}-"
-    todays = df[df["booking_id"].astype(str).str.startswith(prefix)]
-    if todays.empty:
-        seq = 1
-    else:
-        last = todays["booking_id"].iloc[-1]
-        try:
-            seq = int(str(last).split("-")[-1]) + 1
-        except Exception:
-            seq = len(todays) + 1
-    return prefix + f"{seq:03d}"
+    return prefix + f"{next_booking_seq(prefix):03d}"
+
+
+def new_booking(form_data: dict) -> Booking:
+    """Build a pending booking from form data under a freshly reserved id.
+
+    Nothing is written besides the id reservation; persist it with
+    ``insert_booking``.
+    """
+    tickets = int(form_data.get("tickets") or form_data.get("people_count") or 1)
+    return Booking(
+        booking_id=get_next_booking_id(),
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        name=form_data.get("name") or form_data.get("customer_name") or "",
+        phone=form_data.get("phone") or "",
+        tickets=tickets,
+        ticket_price=TICKET_PRICE_AED,
+        total_amount=float(tickets) * TICKET_PRICE_AED,
+        status=BookingStatus.PENDING,
+        payment_intent_id=None,
+        payment_status="pending",
+        redirect_url=None,
+        notes=form_data.get("notes") or "",
+    )
 
 
 def create_booking_and_get_amount(form_data: dict) -> tuple[str, float]:
     """Create a booking row and return (booking_id, total_amount)."""
-    df = load_bookings()
-    booking_id = get_next_booking_id(df)
-    tickets = int(form_data.get("tickets") or form_data.get("people_count") or 1)
-    total_amount = float(tickets) * TICKET_PRICE_AED
-    new_row = {
-        "booking_id": booking_id,
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "name": form_data.get("name") or form_data.get("customer_name") or "",
-        "phone": form_data.get("phone") or "",
-        "tickets": tickets,
-        "ticket_price": TICKET_PRICE_AED,
-        "total_amount": total_amount,
-        "status": "pending",
-        "payment_intent_id": None,
-        "payment_status": "pending",
-        "redirect_url": None,
-        "notes": form_data.get("notes") or "",
-    }
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    save_bookings(df)
-    return booking_id, total_amount
+    booking = new_booking(form_data)
+    insert_booking(booking)
+    return booking.booking_id, booking.total_amount
+
+
+def booking_status_for(payment_status: str | None) -> BookingStatus | None:
+    """Booking status implied by a Ziina payment-intent status, if terminal."""
+    if payment_status == "completed":
+        return BookingStatus.PAID
+    if payment_status in ("failed", "canceled"):
+        return BookingStatus.CANCELLED
+    return None
+
+
+def payment_updates(booking: Booking, payment_status: str | None) -> dict:
+    """Fields to change on ``booking`` for a new intent status.
+
+    Transitions only move forward: pending -> paid/cancelled, and a late
+    ``completed`` may still turn a cancelled booking paid. Paid is final,
+    and repeats of a status already recorded yield no changes.
+    """
+    if not payment_status or booking.is_paid:
+        return {}
+    new_status = booking_status_for(payment_status)
+    if booking.status == BookingStatus.CANCELLED and new_status != BookingStatus.PAID:
+        return {}
+    fields = {}
+    if payment_status != booking.payment_status:
+        fields["payment_status"] = payment_status
+    if new_status and new_status != booking.status:
+        fields["status"] = new_status
+    return fields
+
+
+def apply_payment_status(payment_intent_id: str, payment_status: str | None,
+                         retries: int = 3) -> tuple[Booking | None, bool]:
+    """Record an intent status on its booking.
+
+    Returns (booking, changed); booking is None if no booking carries the
+    intent. Safe to call repeatedly with the same event.
+    """
+    for _ in range(retries):
+        booking = find_booking_by_intent(payment_intent_id)
+        if booking is None:
+            return None, False
+        fields = payment_updates(booking, payment_status)
+        if not fields:
+            return booking, False
+        try:
+            update_booking(booking.booking_id, expected_version=booking.version, **fields)
+        except BookingConflictError:
+            continue  # changed underneath us; re-read and re-decide
+        return booking.with_changes(**fields, version=booking.version + 1), True
+    raise BookingConflictError([booking.booking_id])
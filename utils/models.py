@@ -0,0 +1,91 @@
+"""Typed booking records and status enums."""
+from __future__ import annotations
+from dataclasses import dataclass, fields, replace
+from enum import Enum
+from typing import Any, Mapping, Optional
+
+
+class BookingStatus(str, Enum):
+    PENDING = "pending"
+    PAID = "paid"
+    CANCELLED = "cancelled"
+
+    __str__ = str.__str__
+
+    @classmethod
+    def parse(cls, value) -> "BookingStatus | str":
+        """Enum member for known values; unknown legacy values pass through."""
+        if value is None or value == "":
+            return cls.PENDING
+        try:
+            return cls(str(value))
+        except ValueError:
+            return str(value)
+
+
+# Ziina payment-intent statuses seen by this app
+PAYMENT_STATUSES = (
+    "pending", "requires_payment_instrument", "requires_user_action",
+    "completed", "failed", "canceled",
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Booking:
+    """One booking row. Immutable, so the store can hand out shared
+    instances; use ``with_changes`` to derive an updated copy."""
+
+    booking_id: str
+    created_at: str = ""
+    name: str = ""
+    phone: str = ""
+    tickets: int = 1
+    ticket_price: float = 0.0
+    total_amount: float = 0.0
+    status: BookingStatus | str = BookingStatus.PENDING
+    payment_intent_id: Optional[str] = None
+    payment_status: Optional[str] = None
+    redirect_url: Optional[str] = None
+    notes: str = ""
+    version: int = 1
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> "Booking":
+        return cls(
+            booking_id=str(row["booking_id"]),
+            created_at=row.get("created_at") or "",
+            name=row.get("name") or "",
+            phone="" if row.get("phone") is None else str(row.get("phone")),
+            tickets=int(row.get("tickets") or 0),
+            ticket_price=float(row.get("ticket_price") or 0),
+            total_amount=float(row.get("total_amount") or 0),
+            status=BookingStatus.parse(row.get("status")),
+            payment_intent_id=row.get("payment_intent_id"),
+            payment_status=row.get("payment_status"),
+            redirect_url=row.get("redirect_url"),
+            notes=row.get("notes") or "",
+            version=int(row.get("version") or 1),
+        )
+
+    def to_row(self) -> dict:
+        """Plain dict with the store's column names and primitive values."""
+        row = {f.name: getattr(self, f.name) for f in fields(self)}
+        row["status"] = str(self.status)
+        return row
+
+    def with_changes(self, **changes) -> "Booking":
+        return replace(self, **changes)
+
+    @property
+    def is_paid(self) -> bool:
+        return self.status == BookingStatus.PAID
+
+    # Mapping-style access for code and templates written against row dicts
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
@@ -0,0 +1,127 @@
+"""Draw a ticket as PNG or PDF bytes with Pillow.
+
+Runs inside the ticket render processes, so it imports nothing of the
+app beyond the QR cache.
+"""
+from __future__ import annotations
+import io
+import time
+from functools import lru_cache
+from typing import Optional
+from utils.ticket_qr import qr_code
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = ImageDraw = ImageFont = None
+    PIL_AVAILABLE = False
+
+FORMATS = {"png": "image/png", "pdf": "application/pdf"}
+# Bump when the drawing changes so cached files are not reused
+LAYOUT_VERSION = 2
+
+WIDTH, HEIGHT = 1200, 640
+HEADER_HEIGHT = 200
+QR_SIZE = 300
+GRADIENT = ((0x66, 0x7E, 0xEA), (0x76, 0x4B, 0xA2))
+INK = (0x2D, 0x34, 0x36)
+MUTED = (0x63, 0x6E, 0x72)
+ACCENT = (0x66, 0x7E, 0xEA)
+
+# Looked up in order; the Docker image installs DejaVu
+FONT_CANDIDATES = (
+    "DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "Arial.ttf",
+)
+BOLD_CANDIDATES = (
+    "DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "Arial Bold.ttf",
+)
+
+
+@lru_cache(maxsize=None)
+def _font(size: int, bold: bool = False, path: Optional[str] = None):
+    for candidate in ((path,) if path else ()) + (BOLD_CANDIDATES if bold else FONT_CANDIDATES):
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1
+        return ImageFont.load_default()
+
+
+def _header(draw) -> None:
+    (r0, g0, b0), (r1, g1, b1) = GRADIENT
+    for x in range(WIDTH):
+        t = x / (WIDTH - 1)
+        draw.line([(x, 0), (x, HEADER_HEIGHT)],
+                  fill=(round(r0 + (r1 - r0) * t), round(g0 + (g1 - g0) * t), round(b0 + (b1 - b0) * t)))
+
+
+def _fit(draw, text: str, font, width: int) -> str:
+    """``text`` shortened with an ellipsis to fit ``width`` pixels."""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def draw_ticket(context: dict, font_path: Optional[str] = None):
+    """The ticket as a Pillow image, from ``ticket_generator.ticket_context``."""
+    img = Image.new("RGB", (WIDTH, HEIGHT), "white")
+    draw = ImageDraw.Draw(img)
+    _header(draw)
+    draw.text((60, 50), "SNOW LIWA", font=_font(64, True, font_path), fill="white")
+    draw.text((60, 130), "Entry Ticket", font=_font(30, False, font_path), fill="white")
+
+    fields = [
+        ("Booking ID", str(context["booking_id"])),
+        ("Name", str(context["name"])),
+        ("Date", str(context["formatted_date"])),
+        ("Tickets", str(context["tickets"])),
+        ("Total", f"{float(context['total_amount']):.0f} AED"),
+    ]
+    label_font, value_font = _font(24, False, font_path), _font(34, True, font_path)
+    y = HEADER_HEIGHT + 40
+    for i, (label, value) in enumerate(fields):
+        x, width = (60, 400) if i % 2 == 0 else (480, 340)
+        draw.text((x, y), label.upper(), font=label_font, fill=MUTED)
+        draw.text((x, y + 32), _fit(draw, value, value_font, width), font=value_font,
+                  fill=ACCENT if label == "Booking ID" else INK)
+        if i % 2 == 1:
+            y += 100
+    qr_png = qr_code(context["qr_token"], "png") if context.get("qr_token") else None
+    if qr_png:
+        qr = Image.open(io.BytesIO(qr_png)).convert("RGB").resize((QR_SIZE, QR_SIZE), Image.NEAREST)
+        img.paste(qr, (WIDTH - 60 - QR_SIZE, HEADER_HEIGHT + 25))
+    draw.line([(60, HEIGHT - 80), (WIDTH - 60, HEIGHT - 80)], fill=(0xE0, 0xE0, 0xE0), width=2)
+    draw.text((60, HEIGHT - 60), "Show this ticket at the entrance", font=_font(22, False, font_path), fill=MUTED)
+    return img
+
+
+def render_ticket_bytes(context: dict, fmt: str, font_path: Optional[str] = None) -> bytes:
+    """PNG or PDF bytes for one ticket. Runs in a render worker process."""
+    if not PIL_AVAILABLE:
+        raise RuntimeError("Pillow is not installed")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported ticket format: {fmt}")
+    img = draw_ticket(context, font_path)
+    buf = io.BytesIO()
+    if fmt == "pdf":
+        img.save(buf, "PDF", resolution=150.0)
+    else:
+        img.save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+def render_timed(context: dict, fmt: str, font_path: Optional[str] = None) -> tuple[bytes, float]:
+    """``render_ticket_bytes`` plus the seconds it took inside the worker."""
+    start = time.perf_counter()
+    data = render_ticket_bytes(context, fmt, font_path)
+    return data, time.perf_counter() - start
@@ -0,0 +1,141 @@
+"""QR codes for ticket tokens, encoded once and cached in memory and on disk.
+
+Encoding a QR is a few milliseconds of pure Python per code, which adds
+up when the whole day's guests open their tickets at the gate. Codes are
+therefore kept in a per-process LRU and in ``data/qr/`` (shared by all
+workers and the ticket render processes), keyed by a hash of the token,
+and a day's paid bookings can be generated ahead of time:
+
+    python -m utils.ticket_qr 2026-01-15
+
+Needs the optional ``qrcode`` package (and Pillow for PNG); without it
+tickets keep their placeholder box.
+"""
+from __future__ import annotations
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from core.config import QR_CACHE_DIR, QR_CACHE_SIZE
+
+try:
+    import qrcode
+    QR_AVAILABLE = True
+except ImportError:
+    qrcode = None
+    QR_AVAILABLE = False
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+FORMATS = ("svg", "png")
+PNG_MODULE_PIXELS = 10
+
+_cache: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+_lock = threading.Lock()
+hits = misses = 0
+
+
+def _matrix(token: str) -> list[list[bool]]:
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=2)
+    qr.add_data(token)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _svg(matrix: list[list[bool]]) -> bytes:
+    """One path of horizontal runs; far smaller than a rect per module."""
+    size = len(matrix)
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                runs.append(f"M{start},{y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(runs)}" fill="#000"/></svg>'
+    ).encode("utf-8")
+
+
+def _png(matrix: list[list[bool]]) -> bytes:
+    size = len(matrix)
+    img = Image.new("1", (size, size), 1)
+    img.putdata([0 if cell else 1 for row in matrix for cell in row])
+    img = img.resize((size * PNG_MODULE_PIXELS, size * PNG_MODULE_PIXELS), Image.NEAREST)
+    buf = io.BytesIO()
+    img.save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+def available(fmt: str) -> bool:
+    return QR_AVAILABLE and (fmt == "svg" or Image is not None)
+
+
+def qr_code(token: str, fmt: str = "svg") -> Optional[bytes]:
+    """SVG or PNG bytes encoding ``token``; None if the libraries are missing."""
+    global hits, misses
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported QR format: {fmt}")
+    if not token or not available(fmt):
+        return None
+    key = (token, fmt)
+    with _lock:
+        data = _cache.get(key)
+        if data is not None:
+            _cache.move_to_end(key)
+            hits += 1
+            return data
+    path = QR_CACHE_DIR / f"{hashlib.sha256(token.encode('utf-8')).hexdigest()[:32]}.{fmt}"
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        misses += 1
+        matrix = _matrix(token)
+        data = _svg(matrix) if fmt == "svg" else _png(matrix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+    with _lock:
+        _cache[key] = data
+        _cache.move_to_end(key)
+        while len(_cache) > QR_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return data
+
+
+def pregenerate_day(day: str) -> dict:
+    """Encode (or load) the QR codes of every paid booking created on ``day`` (YYYY-MM-DD)."""
+    from utils.io import iter_bookings
+    from utils.ticket_tokens import ticket_token
+
+    count = 0
+    before = misses
+    for row in iter_bookings(date_from=day, date_to=day, status="paid"):
+        token = ticket_token(row)
+        for fmt in FORMATS:
+            qr_code(token, fmt)
+        count += 1
+    return {"day": day, "bookings": count, "generated": misses - before}
+
+
+def stats() -> dict:
+    return {"available": QR_AVAILABLE, "cached": len(_cache), "hits": hits, "misses": misses}
+
+
+if __name__ == "__main__":
+    import sys
+    from datetime import date
+
+    print(pregenerate_day(sys.argv[1] if len(sys.argv) > 1 else date.today().isoformat()))
@@ -0,0 +1,100 @@
+"""Signed ticket tokens, the payload of the QR code on each paid ticket.
+
+A token is ``<booking_id>.<tickets>.<valid_until>.<signature>``:
+``valid_until`` is the last valid day as a proleptic ordinal
+(``date.toordinal()``) and the signature is a truncated HMAC-SHA256 of the
+rest, base64url without padding. Everything the gate needs is in the
+token, so checking one does not need the bookings table.
+
+The key is ``TICKET_SIGNING_SECRET``; if that is unset, a random key is
+created once in ``data/.ticket_signing_key`` and shared by all workers.
+Changing the key invalidates every ticket already issued.
+"""
+from __future__ import annotations
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+from core.config import DATA_DIR, TICKET_SIGNING_SECRET, TICKET_VALID_DAYS
+
+KEY_FILE = DATA_DIR / ".ticket_signing_key"
+SIGNATURE_BYTES = 16
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_key: Optional[bytes] = None
+
+
+@dataclass(frozen=True, slots=True)
+class TicketClaims:
+    booking_id: str
+    tickets: int
+    valid_until: date
+
+
+def _load_key() -> bytes:
+    global _key
+    if _key is None:
+        if TICKET_SIGNING_SECRET:
+            _key = TICKET_SIGNING_SECRET.encode("utf-8")
+        else:
+            if not KEY_FILE.exists():
+                KEY_FILE.parent.mkdir(parents=True, exist_ok=True)
+                tmp = KEY_FILE.with_name(f"{KEY_FILE.name}.{os.getpid()}.tmp")
+                tmp.write_text(secrets.token_hex(32), encoding="utf-8")
+                try:
+                    # link() fails if another worker created the key first; theirs wins
+                    os.link(tmp, KEY_FILE)
+                except FileExistsError:
+                    pass
+                finally:
+                    tmp.unlink(missing_ok=True)
+            _key = KEY_FILE.read_text(encoding="utf-8").strip().encode("utf-8")
+    return _key
+
+
+def _signature(message: str) -> str:
+    digest = hmac.new(_load_key(), message.encode("utf-8"), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def valid_until_for(created_at: str) -> date:
+    try:
+        day = datetime.strptime(created_at, _TIME_FORMAT).date()
+    except (TypeError, ValueError):
+        day = date.today()
+    return day + timedelta(days=TICKET_VALID_DAYS)
+
+
+def sign_ticket(booking_id: str, tickets: int, valid_until: date) -> str:
+    message = f"{booking_id}.{int(tickets)}.{valid_until.toordinal()}"
+    return f"{message}.{_signature(message)}"
+
+
+def ticket_token(booking) -> Optional[str]:
+    """Token for a paid booking (Booking or row dict); None otherwise."""
+    if str(booking.get("status")) != "paid":
+        return None
+    return sign_ticket(
+        str(booking.get("booking_id")), int(booking.get("tickets") or 0),
+        valid_until_for(booking.get("created_at")),
+    )
+
+
+def verify_ticket(token: str, today: Optional[date] = None) -> Optional[TicketClaims]:
+    """Claims of a genuine, unexpired token; None for anything else."""
+    try:
+        booking_id, tickets, valid_until, signature = token.strip().rsplit(".", 3)
+        claims = TicketClaims(booking_id, int(tickets), date.fromordinal(int(valid_until)))
+    except (AttributeError, ValueError, OverflowError):
+        return None
+    expected = _signature(f"{booking_id}.{tickets}.{valid_until}")
+    # Constant time, so response timing says nothing about how close a forgery got
+    if not hmac.compare_digest(expected.encode("ascii"), signature.encode("ascii", "replace")):
+        return None
+    if not booking_id or claims.tickets <= 0 or claims.valid_until < (today or date.today()):
+        return None
+    return claims